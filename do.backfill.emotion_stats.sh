@@ -0,0 +1,3 @@
+#!/bin/sh
+
+python -m src.services.maintenance emotion_stats
@@ -1,13 +1,20 @@
 #!/usr/bin/env python
 
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, status
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
 from starlette.middleware.cors import CORSMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from fastapi_limiter import FastAPILimiter
 import redis.asyncio as redis
 
 from src.conf.config import config
 from src.routes import auth, users, images, tags, comments
+from src.services.emometer import emometer_workers
+from src.services.events import comment_events
+from src.services.pool import shutdown_process_pool
+from src.services.scheduler import start_scheduler, shutdown_scheduler
 
 app = FastAPI(title="YOPS.FUN App",
     description = "<h2>Your Opinions, Pictures, Status for FUN</h2><br>" \
@@ -23,6 +30,83 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+# Number of files of config.upload_max_size which multipart bodies of upload
+# routes may contain. Multipart bodies of other routes contain no files.
+UPLOAD_ROUTES = {
+    "/api/images": 1,
+    "/api/images/batch": config.upload_batch_size,
+    "/api/users/avatar": 1,
+}
+# Room for multipart boundaries, part headers and form fields
+MULTIPART_OVERHEAD = 65536
+
+
+def upload_body_limit(path: str) -> int:
+    """
+    Get the maximum size of multipart body of route.
+
+    Args:
+        path (str): Request path.
+
+    Returns:
+        int: Size in bytes.
+    """
+    files = UPLOAD_ROUTES.get(path.rstrip("/"), 0)
+    return config.upload_max_size * files + MULTIPART_OVERHEAD
+
+
+class LimitUploadSize:
+    """
+    Reject too big multipart bodies with 413 by the limit of their route.
+    Content-Length is checked before the body is received, and received
+    bytes are counted while the body is streamed, so chunked bodies without
+    Content-Length are limited too. Each uploaded file is validated again
+    while it is read.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        headers = Headers(scope=scope)
+        if scope["type"] != "http" or not headers.get(
+            "content-type", ""
+        ).startswith("multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        max_size = upload_body_limit(scope["path"])
+        content_length = headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > max_size:
+            response = JSONResponse(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                content={"detail": "Request is too large."},
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def receive_limited() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_size:
+                    # It is raised from the body parser, so it becomes 413
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail="Request is too large.",
+                    )
+            return message
+
+        await self.app(scope, receive_limited, send)
+
+
+app.add_middleware(LimitUploadSize)
+
+
 app.include_router(auth.router)
 app.include_router(users.router, prefix="/api")
 app.include_router(images.router, prefix="/api")
@@ -37,7 +121,9 @@ async def startup():
 
     This function creates a connection to the Redis server using the
     configuration parameters and initializes the FastAPILimiter with the
-    Redis connection.
+    Redis connection. It also starts the scheduler of background sweeps,
+    like destroying of deleted images in Cloudinary, the workers of
+    the emotion rating queue and the listener of comment events.
 
     Returns:
         None
@@ -51,6 +137,24 @@ async def startup():
         decode_responses=True,
     )
     await FastAPILimiter.init(r)
+    start_scheduler()
+    emometer_workers.start()
+    comment_events.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """
+    Stop the scheduler, the emotion rating workers, the listener of comment
+    events and the process pool on shutdown.
+
+    Returns:
+        None
+    """
+    shutdown_scheduler()
+    await emometer_workers.stop()
+    await comment_events.stop()
+    shutdown_process_pool()
 
 
 @app.get("/")
@@ -6,6 +6,25 @@ class Settings(BaseSettings):
     secret_key: str = "SECRET_KEY"
     algorithm: str = "HS256"
     small_image_size: int = 100
+    variant_cache_size: int = 1024
+    qr_cache_size: int = 512
+    qr_batch_size: int = 100
+    qr_url_expire: int = 604800
+    upload_batch_size: int = 20
+    upload_concurrency: int = 4
+    upload_max_size: int = 10485760
+    upload_max_pixels: int = 40000000
+    upload_processing: bool = False
+    upload_format: str = "WEBP"
+    upload_quality: int = 82
+    worker_processes: int = 2
+
+    asset_deletion_batch_size: int = 100
+    asset_deletion_interval: int = 30
+    asset_deletion_max_attempts: int = 8
+    asset_deletion_backoff: int = 60
+    asset_deletion_backoff_max: int = 21600
+    counters_repair_interval: int = 3600
 
     postgres_user: str = "POSTGRES_USER"
     postgres_password: str = "POSTGRES_PASSWORD"
@@ -28,6 +47,31 @@ class Settings(BaseSettings):
     cloudinary_api_secret: str = "CLOUDINARY_API_SECRET"
 
     gpt_api_key: str = "GPT_API_KEY"
+    gpt_api_base: str | None = None
+    gpt_model: str = "gpt-3.5-turbo"
+    llm_concurrency: int = 4
+    llm_rpm: int = 3500
+    llm_tpm: int = 90000
+    llm_timeout: float = 30.0
+    llm_retries: int = 4
+    llm_backoff: float = 1.0
+    llm_backoff_max: float = 30.0
+    emometer_backend: str = "llm"
+    emometer_json: bool = False
+    lexicon_min_coverage: float = 0.6
+    emometer_batch_size: int = 20
+    emometer_batch_window_ms: int = 500
+    emometer_workers: int = 2
+    emometer_lease: int = 300
+    emometer_max_attempts: int = 6
+    emometer_backoff: int = 30
+    emometer_backoff_max: int = 3600
+    emometer_debounce_seconds: int = 20
+    emo_cache_size: int = 4096
+    emo_cache_ttl: int = 2592000
+    events_queue_size: int = 100
+    events_heartbeat: float = 15.0
+    events_send_timeout: float = 5.0
 
     model_config = ConfigDict(
         env_file=".env", env_file_encoding="utf-8", extra="ignore"
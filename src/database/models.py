@@ -4,8 +4,8 @@ from datetime import date
 
 from sqlalchemy import Boolean, Column, DateTime, ForeignKey, UniqueConstraint
 from sqlalchemy import Integer, SmallInteger, String, Table, Text, func
-from sqlalchemy import Enum
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import CheckConstraint, Enum, Index
+from sqlalchemy.orm import Mapped, backref, mapped_column, relationship
 
 
 from src.database.connect import Base
@@ -17,8 +17,13 @@ tag_m2m_image = Table(
     Column("id", Integer, primary_key=True),
     Column("image_id", Integer, ForeignKey("images.id", ondelete="CASCADE")),
     Column("tag_id", Integer, ForeignKey("tags.id", ondelete="CASCADE")),
+    # Position of tag among up to 5 tags of image. Each position is taken
+    # once, so concurrent assignments cannot exceed the limit
+    Column("slot", SmallInteger, nullable=True),
     # Only 1 time can be assign the same tag to the same image
     UniqueConstraint("image_id", "tag_id", name="tag_image"),
+    UniqueConstraint("image_id", "slot", name="tag_image_slot"),
+    CheckConstraint("slot BETWEEN 1 AND 5", name="tag_image_slot_range"),
 )
 
 
@@ -36,6 +41,22 @@ class Image(Base):
     cloud_version: Mapped[str] = mapped_column(Integer, nullable=False)
     """about is a description about image"""
     about: Mapped[str] = mapped_column(Text, nullable=False, default="")
+    """original_size and stored_size are sizes in bytes of uploaded and stored
+       (re-encoded) file. They show how many bytes upload processing saves"""
+    original_size: Mapped[int] = mapped_column(Integer, nullable=True)
+    stored_size: Mapped[int] = mapped_column(Integer, nullable=True)
+    """comment_count, star_count and star_sum (sum of star levels) are kept
+       together with comments and stars, so lists of images show them without
+       counting. images_counters_repair() fixes them if they drift"""
+    comment_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    star_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    star_sum: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
     created_at: Mapped[date] = mapped_column("created_at", DateTime, default=func.now())
     updated_at: Mapped[date] = mapped_column(
         "updated_at", DateTime, default=func.now(), onupdate=func.now()
@@ -45,7 +66,9 @@ class Image(Base):
     user_id: Mapped[int] = mapped_column(
         Integer, ForeignKey("users.id"), nullable=False
     )
-    user: Mapped["User"] = relationship("User", backref="images", lazy="joined")
+    """Relationships are not loaded implicitly, queries which need them opt in
+       by options(joinedload(...)) or options(selectinload(...))"""
+    user: Mapped["User"] = relationship("User", backref="images", lazy="raise")
 
 
 class Tag(Base):
@@ -131,19 +154,39 @@ class Comment(Base):
     emo_surprise: Mapped[int] = mapped_column(SmallInteger, nullable=False, default=0)
     emo_disgust: Mapped[int] = mapped_column(SmallInteger, nullable=False, default=0)
     emo_fear: Mapped[int] = mapped_column(SmallInteger, nullable=False, default=0)
+    """rated_at is time of the last emotion rating, None while comment is not
+       rated. Only rated comments are counted by image_emotion_stats"""
+    rated_at: Mapped[date] = mapped_column("rated_at", DateTime, nullable=True)
+    """revision is incremented on each edit of text, so rates of older text
+       are not stored"""
+    revision: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=1, server_default="1"
+    )
     created_at: Mapped[date] = mapped_column("created_at", DateTime, default=func.now())
     updated_at: Mapped[date] = mapped_column(
         "updated_at", DateTime, default=func.now(), onupdate=func.now()
     )
     image_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey("images.id"), nullable=False
+        Integer, ForeignKey("images.id", ondelete="CASCADE"), nullable=False
+    )
+    """Comments are deleted by database together with their image"""
+    image: Mapped["Image"] = relationship(
+        "Image", backref=backref("comments", passive_deletes=True), lazy="raise"
     )
-    image: Mapped["Image"] = relationship("Image", backref="comments", lazy="joined")
     """user_id always must be present because comment is created by specific user"""
     user_id: Mapped[int] = mapped_column(
         Integer, ForeignKey("users.id"), nullable=False
     )
-    user: Mapped["User"] = relationship("User", backref="comments", lazy="joined")
+    user: Mapped["User"] = relationship("User", backref="comments", lazy="raise")
+
+
+# Pages of comments of image, the newest first, are read by index range scan
+Index(
+    "ix_comments_image_id_created_at_id",
+    Comment.image_id,
+    Comment.created_at.desc(),
+    Comment.id.desc(),
+)
 
 
 class Star(Base):
@@ -155,17 +198,93 @@ class Star(Base):
         "updated_at", DateTime, default=func.now(), onupdate=func.now()
     )
     image_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey("images.id"), nullable=True
+        Integer, ForeignKey("images.id", ondelete="CASCADE"), nullable=True, index=True
+    )
+    image: Mapped["Image"] = relationship(
+        "Image", backref=backref("stars", passive_deletes=True), lazy="raise"
     )
-    image: Mapped["Image"] = relationship("Image", backref="stars", lazy="joined")
     """user_id always must be present because star level is defined by specific user"""
     user_id: Mapped[int] = mapped_column(
         Integer, ForeignKey("users.id"), nullable=False
     )
-    user: Mapped["User"] = relationship("User", backref="stars", lazy="joined")
+    user: Mapped["User"] = relationship("User", backref="stars", lazy="raise")
 
 
 class Logout(Base):
     __tablename__ = "logouts"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     access_token: Mapped[str] = mapped_column(String(255), nullable=False)
+
+
+class AssetDeletion(Base):
+    """Outbox of cloudinary assets which must be destroyed in background"""
+    __tablename__ = "asset_deletions"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    cloud_public_id: Mapped[str] = mapped_column(String(255), nullable=False)
+    """attempts is amount of failed deletions. Asset is orphaned when it reaches
+       config.asset_deletion_max_attempts"""
+    attempts: Mapped[int] = mapped_column(SmallInteger, nullable=False, default=0)
+    next_attempt_at: Mapped[date] = mapped_column(
+        "next_attempt_at", DateTime, nullable=False, default=func.now(), index=True
+    )
+    last_error: Mapped[str] = mapped_column(Text, nullable=True)
+    created_at: Mapped[date] = mapped_column("created_at", DateTime, default=func.now())
+
+
+class ImageVariant(Base):
+    """Memoized cloudinary transformation urls (crops, resizes) of image"""
+    __tablename__ = "image_variants"
+    __table_args__ = (
+        # Only 1 url is stored for the same transformation of the same image
+        UniqueConstraint("image_id", "width", "height", "crop", name="image_variant"),
+    )
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    image_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("images.id", ondelete="CASCADE"), nullable=False
+    )
+    width: Mapped[int] = mapped_column(Integer, nullable=False)
+    height: Mapped[int] = mapped_column(Integer, nullable=False)
+    """crop is cloudinary crop mode, like "fill", "fit", "thumb", etc."""
+    crop: Mapped[str] = mapped_column(String(16), nullable=False)
+    url: Mapped[str] = mapped_column(String(255), nullable=False)
+    created_at: Mapped[date] = mapped_column("created_at", DateTime, default=func.now())
+
+
+class EmometerJob(Base):
+    """Durable queue of comments which must be rated by emometer"""
+    __tablename__ = "emometer_jobs"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    """Only 1 job is queued for the same comment"""
+    comment_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("comments.id", ondelete="CASCADE"),
+        nullable=False,
+        unique=True,
+    )
+    """attempts is amount of failed ratings. Job is dead when it reaches
+       config.emometer_max_attempts"""
+    attempts: Mapped[int] = mapped_column(SmallInteger, nullable=False, default=0)
+    run_at: Mapped[date] = mapped_column(
+        "run_at", DateTime, nullable=False, default=func.now(), index=True
+    )
+    """locked_until is the end of lease of worker which has claimed the job.
+       Job of crashed worker is claimed again after its lease"""
+    locked_until: Mapped[date] = mapped_column("locked_until", DateTime, nullable=True)
+    last_error: Mapped[str] = mapped_column(Text, nullable=True)
+    created_at: Mapped[date] = mapped_column("created_at", DateTime, default=func.now())
+
+
+class ImageEmotionStats(Base):
+    """Sums of emotion rates of rated comments of image. They are updated
+       incrementally together with the comments"""
+    __tablename__ = "image_emotion_stats"
+    image_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("images.id", ondelete="CASCADE"), primary_key=True
+    )
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sum_joy: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sum_anger: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sum_sadness: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sum_surprise: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sum_disgust: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sum_fear: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
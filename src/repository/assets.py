@@ -0,0 +1,132 @@
+from datetime import timedelta
+from typing import List
+
+from sqlalchemy import select, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import config
+from src.database.models import AssetDeletion
+
+
+async def asset_deletion_enqueue(
+    public_ids: List[str], db: AsyncSession, delay: timedelta | None = None
+) -> None:
+    """
+    Adds cloudinary assets to the deletion outbox. Nothing is committed
+    here, so the assets are enqueued in the same transaction as the caller
+    deletes its own records.
+
+    :param public_ids: Cloudinary public IDs of assets to destroy.
+    :type public_ids: List[str]
+    :param db: The database session.
+    :type db: AsyncSession
+    :param delay: Time to keep the assets before destroying.
+    :type delay: timedelta | None
+    """
+    # Time is taken from the database clock, which claims compare it with
+    next_attempt_at = func.now() + delay if delay else func.now()
+    db.add_all(
+        [
+            AssetDeletion(cloud_public_id=public_id, next_attempt_at=next_attempt_at)
+            for public_id in public_ids
+        ]
+    )
+
+
+async def asset_deletions_add(public_ids: List[str], db: AsyncSession) -> None:
+    """
+    Enqueues assets which are uploaded but not stored, like when the insert
+    of their images fails, so they are not orphaned in cloudinary.
+
+    :param public_ids: Cloudinary public IDs of assets to destroy.
+    :type public_ids: List[str]
+    :param db: The database session.
+    :type db: AsyncSession
+    """
+    if public_ids:
+        await asset_deletion_enqueue(public_ids, db)
+        await db.commit()
+
+
+async def asset_deletions_claim(limit: int, db: AsyncSession) -> List[AssetDeletion]:
+    """
+    Locks due deletions which are not orphaned yet. Locked rows are skipped,
+    so several workers never claim the same asset.
+
+    :param limit: Maximal amount of claimed deletions.
+    :type limit: int
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: Claimed deletions.
+    :rtype: List[AssetDeletion]
+    """
+    sq = (
+        select(AssetDeletion)
+        .filter(
+            AssetDeletion.next_attempt_at <= func.now(),
+            AssetDeletion.attempts < config.asset_deletion_max_attempts,
+        )
+        .order_by(AssetDeletion.next_attempt_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    result = await db.execute(sq)
+    return result.scalars().all()
+
+
+async def asset_deletions_done(
+    deletions: List[AssetDeletion], db: AsyncSession
+) -> None:
+    """
+    Removes processed deletions from the outbox.
+    """
+    if deletions:
+        sq = delete(AssetDeletion).where(
+            AssetDeletion.id.in_([deletion.id for deletion in deletions])
+        )
+        await db.execute(sq)
+    await db.commit()
+
+
+async def asset_deletions_retry(
+    deletions: List[AssetDeletion], error: str, db: AsyncSession
+) -> List[AssetDeletion]:
+    """
+    Postpones failed deletions with exponential backoff.
+
+    :param deletions: Failed deletions.
+    :type deletions: List[AssetDeletion]
+    :param error: Reason of failure.
+    :type error: str
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: Deletions which became orphaned after this failure.
+    :rtype: List[AssetDeletion]
+    """
+    orphans = []
+    for deletion in deletions:
+        deletion.attempts += 1
+        deletion.last_error = error
+        backoff = min(
+            config.asset_deletion_backoff * 2 ** (deletion.attempts - 1),
+            config.asset_deletion_backoff_max,
+        )
+        deletion.next_attempt_at = func.now() + timedelta(seconds=backoff)
+        if deletion.attempts >= config.asset_deletion_max_attempts:
+            orphans.append(deletion)
+    await db.commit()
+    return orphans
+
+
+async def asset_deletions_stats(db: AsyncSession) -> dict:
+    """
+    Counts pending and orphaned (not destroyed after all attempts) assets.
+    """
+    orphaned = AssetDeletion.attempts >= config.asset_deletion_max_attempts
+    sq = select(
+        func.count(AssetDeletion.id).filter(~orphaned),
+        func.count(AssetDeletion.id).filter(orphaned),
+    )
+    result = await db.execute(sq)
+    pending, orphaned = result.one()
+    return {"pending": pending, "orphaned": orphaned}
@@ -1,73 +1,214 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import List
 
-from sqlalchemy import select, and_, or_, desc
+from sqlalchemy import Row, select, insert, update, delete, and_, or_, desc, func
+from sqlalchemy import literal, null, tuple_
+from sqlalchemy import SmallInteger
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
-from src.database.models import Comment, Image, User, Role
+from src.conf.config import config
+from src.database.models import (
+    Comment,
+    EmometerJob,
+    Image,
+    ImageEmotionStats,
+    User,
+    Role,
+)
+from src.repository.emometer import (
+    EMO_FIELDS,
+    SUM_FIELDS,
+    emometer_job_cancel,
+    emometer_job_enqueue,
+    emotion_delta,
+    image_emotion_stats_apply,
+)
 # from src.repository.admin import (
 #     check_permission,
 # )
-from src.schemas import CommentUpdateSchema
+from src.schemas import CommentBulkDeleteSchema, CommentUpdateSchema
 
 
-async def update_emometer(
-    joy: int, anger: int, sadness: int, surprise: int, disgust: int, fear: int,
-    comment_id, db: AsyncSession
-) -> None:
-    sq = select(Comment).filter(Comment.id == comment_id)
-    result = await db.execute(sq)
-    comment = result.scalar_one_or_none()
-    if comment:
-        ( comment.emo_joy, comment.emo_anger, comment.emo_sadness,
-        comment.emo_surprise, comment.emo_disgust, comment.emo_fear
-        ) = (
-            joy, anger, sadness,
-            surprise, disgust, fear
-        )
-        await db.commit()
-        await db.refresh(comment)
+def comment_rates(comment: Comment) -> tuple | None:
+    """
+    Emotion rates (joy, anger, sadness, surprise, disgust, fear) of comment,
+    None if it is not rated.
+    """
+    if comment.rated_at is None:
+        return None
+    return tuple(getattr(comment, field) for field in EMO_FIELDS)
 
 
 async def create_comment(
-    text: str, user_id: User, image_id: Image, db: AsyncSession
-) -> Comment:
-    comment = Comment(
-        comment=text,
-        user_id=user_id,
-        image_id=image_id,
+    text: str, user_id: User, image_id: Image, db: AsyncSession,
+    rates: tuple | None = None
+) -> Comment | None:
+    """
+    Creates comment of existing image and counts it in comment_count of image
+    by one INSERT ... SELECT ... RETURNING statement. Emotion rates are stored
+    at once when they are known (like cached rates of the same text), and
+    added to emotion stats of image, otherwise the comment is queued for
+    emotion rating, by CTEs of the same statement.
+
+    :return: Created comment, or None if image does not exist.
+    """
+    # Python-side column defaults are not applied to INSERT CTEs of one
+    # statement, so every NOT NULL column is set explicitly
+    source = select(
+        literal(text).label("comment"),
+        literal(user_id).label("user_id"),
+        Image.id.label("image_id"),
+        (func.now() if rates is not None else null()).label("rated_at"),
+        *[
+            literal(rate, SmallInteger).label(field)
+            for field, rate in zip(EMO_FIELDS, rates or (0,) * len(EMO_FIELDS))
+        ],
+        literal(1).label("revision"),
+        func.now().label("created_at"),
+        func.now().label("updated_at"),
+    ).where(Image.id == image_id)
+    new_comment = (
+        insert(Comment)
+        .from_select(
+            [column.name for column in source.selected_columns],
+            source,
+            include_defaults=False,
+        )
+        .returning(*Comment.__table__.c)
+        .cte("new_comment")
+    )
+    counter = (
+        update(Image)
+        .where(Image.id == new_comment.c.image_id)
+        .values(comment_count=Image.comment_count + 1, updated_at=Image.updated_at)
+        .returning(Image.id)
+        .cte("counter")
     )
+    if rates is None:
+        follow_up = (
+            insert(EmometerJob)
+            .from_select(
+                ["comment_id", "attempts", "run_at", "created_at"],
+                select(
+                    new_comment.c.id, literal(0, SmallInteger), func.now(), func.now()
+                ),
+                include_defaults=False,
+            )
+            .returning(EmometerJob.id)
+            .cte("job")
+        )
+    else:
+        rated = select(
+            new_comment.c.image_id,
+            literal(1),
+            *[new_comment.c[field] for field in EMO_FIELDS],
+        )
+        follow_up = pg_insert(ImageEmotionStats).from_select(
+            ["image_id", "count", *SUM_FIELDS], rated
+        )
+        follow_up = (
+            follow_up.on_conflict_do_update(
+                index_elements=[ImageEmotionStats.image_id],
+                set_={
+                    field: getattr(ImageEmotionStats, field)
+                    + getattr(follow_up.excluded, field)
+                    for field in ("count", *SUM_FIELDS)
+                },
+            )
+            .returning(ImageEmotionStats.image_id)
+            .cte("stats")
+        )
 
-    db.add(comment)
+    sq = select(aliased(Comment, new_comment)).add_cte(counter, follow_up)
+    result = await db.execute(sq)
+    comment = result.scalar_one_or_none()
     await db.commit()
-    await db.refresh(comment)
     return comment
 
 
-async def get_comments_for_image(image_id: int, db: AsyncSession):
+async def get_comments_for_image(
+    image_id: int,
+    db: AsyncSession,
+    limit: int = 50,
+    after: tuple[datetime, int] | None = None,
+) -> List[Row]:
+    """
+    Reads one page of comments of image, the newest first. Pages are keyed
+    by (created_at, id) of the last comment of the previous page, so any
+    page is read from index comments(image_id, created_at, id) without
+    skipping rows. Only displayed columns are read, with username and avatar
+    of author, into plain rows instead of ORM objects.
+
+    :param image_id: The ID of image.
+    :param db: The database session.
+    :param limit: Maximal amount of comments on page.
+    :param after: Creation time and ID of the last comment of the previous
+                  page, None for the first page.
+    :return: Rows (id, comment, created_at, user_id, username, avatar)
+             of comments of page.
+    """
     stmt = (
-        select(Comment)
+        select(
+            Comment.id,
+            Comment.comment,
+            Comment.created_at,
+            Comment.user_id,
+            User.username,
+            User.avatar,
+        )
+        .join(User, Comment.user_id == User.id)
         .where(Comment.image_id == image_id)
-        .order_by(desc(Comment.created_at))
     )
+    if after is not None:
+        stmt = stmt.where(tuple_(Comment.created_at, Comment.id) < after)
+    stmt = stmt.order_by(desc(Comment.created_at), desc(Comment.id)).limit(limit)
     results = await db.execute(stmt)
-    comments = results.scalars().all()
-    return comments
+    return results.all()
 
 
-async def update_comment(body: CommentUpdateSchema, user: User, db: AsyncSession):
+async def update_comment(
+    body: CommentUpdateSchema, user: User, db: AsyncSession,
+    rates: tuple | None = None
+) -> tuple[Comment | None, bool]:
+    """
+    Updates comment text and increments its revision. Emotion rates are
+    replaced by known rates of the new text, if any, otherwise the comment
+    is queued for emotion rating after config.emometer_debounce_seconds of
+    quiet, so only the latest of rapid edits is rated.
+
+    :return: Updated comment (None if it is not accessible) and whether
+             comment text is changed.
+    """
     sq = select(Comment).filter(and_(Comment.id == body.comment_id,
                                      or_(user.role == Role.admin,
                                          user.role == Role.moder,
                                          Comment.user_id == user.id)))
+    sq = sq.with_for_update(of=Comment)
 
     result = await db.execute(sq)
     comment = result.scalar_one_or_none()
 
-    if comment:
+    changed = comment is not None and comment.comment != body.comment
+    if changed:
         comment.comment = body.comment
+        comment.revision += 1
         comment.updated_at = datetime.now()
+        if rates is None:
+            await emometer_job_enqueue(
+                comment.id, db, timedelta(seconds=config.emometer_debounce_seconds)
+            )
+        else:
+            await emometer_job_cancel(comment.id, db)
+            deltas = {}
+            emotion_delta(deltas, comment.image_id, comment_rates(comment), rates)
+            await image_emotion_stats_apply(deltas, db)
+            for field, rate in zip(EMO_FIELDS, rates):
+                setattr(comment, field, rate)
+            comment.rated_at = datetime.now()
         await db.commit()
-    return comment
+    return comment, changed
 
 
 async def delete_comment(comment_id: int, user: User, db: AsyncSession):
@@ -75,10 +216,104 @@ async def delete_comment(comment_id: int, user: User, db: AsyncSession):
                                      or_(user.role == Role.admin,
                                          user.role == Role.moder)))
     # print(f"[X] sq='{sq}', user.role='{user.role}', user.name='{user.username}'")
+    sq = sq.with_for_update(of=Comment)
     result = await db.execute(sq)
     comment = result.scalar_one_or_none()
 
     if comment:
+        sq = (
+            update(Image)
+            .where(Image.id == comment.image_id)
+            .values(
+                comment_count=Image.comment_count - 1, updated_at=Image.updated_at
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await db.execute(sq)
+        deltas = {}
+        emotion_delta(deltas, comment.image_id, comment_rates(comment), None)
+        await image_emotion_stats_apply(deltas, db)
         await db.delete(comment)
         await db.commit()
     return comment
+
+
+async def delete_comments_bulk(
+    body: CommentBulkDeleteSchema, db: AsyncSession
+) -> List[Row]:
+    """
+    Deletes comments selected by IDs, author, image and creation time window
+    (all given conditions must match) by one DELETE ... RETURNING statement.
+    Its CTEs decrement comment_count and emotion stats of affected images in
+    the same statement, and queued emometer jobs are deleted by cascade.
+
+    :param body: Conditions of deleted comments.
+    :param db: The database session.
+    :return: Rows (id, image_id) of deleted comments.
+    """
+    conditions = []
+    if body.comment_ids is not None:
+        conditions.append(Comment.id.in_(body.comment_ids))
+    if body.user_id is not None:
+        conditions.append(Comment.user_id == body.user_id)
+    if body.image_id is not None:
+        conditions.append(Comment.image_id == body.image_id)
+    if body.created_from is not None:
+        conditions.append(Comment.created_at >= body.created_from)
+    if body.created_to is not None:
+        conditions.append(Comment.created_at < body.created_to)
+
+    deleted = (
+        delete(Comment)
+        .where(*conditions)
+        .returning(
+            Comment.id,
+            Comment.image_id,
+            Comment.rated_at,
+            *[getattr(Comment, field) for field in EMO_FIELDS],
+        )
+        .cte("deleted")
+    )
+    counts = (
+        select(deleted.c.image_id, func.count().label("count"))
+        .group_by(deleted.c.image_id)
+        .subquery("counts")
+    )
+    images = (
+        update(Image)
+        .where(Image.id == counts.c.image_id)
+        .values(
+            comment_count=Image.comment_count - counts.c.count,
+            updated_at=Image.updated_at,
+        )
+        .returning(Image.id)
+        .cte("images")
+    )
+    rated = (
+        select(
+            deleted.c.image_id,
+            func.count().label("count"),
+            *[func.sum(deleted.c[field]).label(field) for field in EMO_FIELDS],
+        )
+        .where(deleted.c.rated_at.is_not(None))
+        .group_by(deleted.c.image_id)
+        .subquery("rated")
+    )
+    stats = (
+        update(ImageEmotionStats)
+        .where(ImageEmotionStats.image_id == rated.c.image_id)
+        .values(
+            count=ImageEmotionStats.count - rated.c.count,
+            **{
+                sum_field: getattr(ImageEmotionStats, sum_field) - rated.c[field]
+                for sum_field, field in zip(SUM_FIELDS, EMO_FIELDS)
+            },
+        )
+        .returning(ImageEmotionStats.image_id)
+        .cte("stats")
+    )
+    sq = select(deleted.c.id, deleted.c.image_id).add_cte(images, stats)
+    result = await db.execute(sq)
+    comments = result.all()
+    await db.commit()
+    return comments
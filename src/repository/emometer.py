@@ -0,0 +1,349 @@
+from datetime import timedelta
+from typing import Dict, List
+
+from sqlalchemy import select, insert, update, delete, values, column, func, or_
+from sqlalchemy import text, tuple_
+from sqlalchemy import Integer, SmallInteger
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import config
+from src.database.models import Comment, EmometerJob, ImageEmotionStats
+
+
+EMO_FIELDS = (
+    "emo_joy", "emo_anger", "emo_sadness", "emo_surprise", "emo_disgust", "emo_fear"
+)
+SUM_FIELDS = (
+    "sum_joy", "sum_anger", "sum_sadness", "sum_surprise", "sum_disgust", "sum_fear"
+)
+
+
+def emotion_delta(
+    deltas: Dict[int, list], image_id: int, old: tuple | None, new: tuple | None
+) -> None:
+    """
+    Accumulates change of image emotion stats when rates of one comment of
+    image change from old to new.
+
+    :param deltas: Changes of count and sums of rates by image ID.
+    :type deltas: Dict[int, list]
+    :param image_id: The ID of image of comment.
+    :type image_id: int
+    :param old: Previous rates of comment, None if it was not rated.
+    :type old: tuple | None
+    :param new: New rates of comment, None if it is deleted.
+    :type new: tuple | None
+    """
+    delta = deltas.setdefault(image_id, [0] * (len(SUM_FIELDS) + 1))
+    for rates, sign in ((old, -1), (new, 1)):
+        if rates is not None:
+            delta[0] += sign
+            for i, rate in enumerate(rates, start=1):
+                delta[i] += sign * rate
+
+
+async def image_emotion_stats_apply(deltas: Dict[int, list], db: AsyncSession) -> None:
+    """
+    Adds changes to image emotion stats by one upsert. Nothing is committed
+    here, so stats are changed in the same transaction as comments.
+
+    :param deltas: Changes of count and sums of rates by image ID.
+    :type deltas: Dict[int, list]
+    :param db: The database session.
+    :type db: AsyncSession
+    """
+    rows = [
+        {"image_id": image_id, "count": delta[0], **dict(zip(SUM_FIELDS, delta[1:]))}
+        for image_id, delta in sorted(deltas.items())
+        if any(delta)
+    ]
+    if not rows:
+        return
+    sq = pg_insert(ImageEmotionStats).values(rows)
+    sq = sq.on_conflict_do_update(
+        index_elements=[ImageEmotionStats.image_id],
+        set_={
+            field: getattr(ImageEmotionStats, field) + getattr(sq.excluded, field)
+            for field in ("count", *SUM_FIELDS)
+        },
+    )
+    await db.execute(sq)
+
+
+async def image_emotion_stats_read(image_id: int, db: AsyncSession) -> dict:
+    """
+    Reads average emotion rates of rated comments of image.
+
+    :param image_id: The ID of image.
+    :type image_id: int
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: Amount of rated comments and average rate of each emotion.
+    :rtype: dict
+    """
+    stats = await db.get(ImageEmotionStats, image_id)
+    count = stats.count if stats else 0
+    averages = {
+        field[len("sum_"):]: round(getattr(stats, field) / count, 1) if count else 0.0
+        for field in SUM_FIELDS
+    }
+    return {"image_id": image_id, "count": count, **averages}
+
+
+async def image_emotion_stats_backfill(db: AsyncSession) -> int:
+    """
+    Recomputes image emotion stats from rated comments by one aggregate
+    query. The stats table is locked against concurrent writers, which
+    apply their changes on top of the recomputed stats after commit.
+
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: Amount of images with rated comments.
+    :rtype: int
+    """
+    await db.execute(text("LOCK TABLE image_emotion_stats IN EXCLUSIVE MODE"))
+    await db.execute(delete(ImageEmotionStats))
+    rated = (
+        select(
+            Comment.image_id,
+            func.count(Comment.id),
+            *[func.sum(getattr(Comment, field)) for field in EMO_FIELDS],
+        )
+        .where(Comment.rated_at.is_not(None))
+        .group_by(Comment.image_id)
+    )
+    sq = insert(ImageEmotionStats).from_select(
+        ["image_id", "count", *SUM_FIELDS], rated
+    )
+    result = await db.execute(sq)
+    await db.commit()
+    return result.rowcount
+
+
+async def update_emometer(scores: Dict[int, tuple], db: AsyncSession) -> None:
+    """
+    Stores emotion rates of many comments by one UPDATE ... FROM (VALUES ...)
+    and applies the change to image emotion stats. Nothing is committed here.
+
+    :param scores: Rates (joy, anger, sadness, surprise, disgust, fear)
+                   by comment ID.
+    :param db: The database session.
+    """
+    if not scores:
+        return
+    sq = (
+        select(Comment.id, Comment.image_id, Comment.rated_at)
+        .add_columns(*[getattr(Comment, field) for field in EMO_FIELDS])
+        .where(Comment.id.in_(list(scores)))
+        .order_by(Comment.id)
+        .with_for_update(of=Comment)
+    )
+    result = await db.execute(sq)
+    deltas = {}
+    for comment_id, image_id, rated_at, *old in result.all():
+        emotion_delta(
+            deltas, image_id, tuple(old) if rated_at else None, scores[comment_id]
+        )
+
+    rates = values(
+        column("id", Integer),
+        column("joy", SmallInteger),
+        column("anger", SmallInteger),
+        column("sadness", SmallInteger),
+        column("surprise", SmallInteger),
+        column("disgust", SmallInteger),
+        column("fear", SmallInteger),
+        name="rates",
+    ).data([(comment_id, *rate) for comment_id, rate in scores.items()])
+    sq = (
+        update(Comment)
+        .where(Comment.id == rates.c.id)
+        .values(
+            emo_joy=rates.c.joy,
+            emo_anger=rates.c.anger,
+            emo_sadness=rates.c.sadness,
+            emo_surprise=rates.c.surprise,
+            emo_disgust=rates.c.disgust,
+            emo_fear=rates.c.fear,
+            rated_at=func.now(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(sq)
+    await image_emotion_stats_apply(deltas, db)
+
+
+async def emometer_job_enqueue(
+    comment_id: int, db: AsyncSession, delay: timedelta | None = None
+) -> None:
+    """
+    Queues comment for emotion rating. Nothing is committed here, so the job
+    is stored in the same transaction as the caller stores the comment.
+    A queued job of the same comment is rescheduled, released from its
+    worker and its failures are forgotten, so repeated edits during delay
+    are coalesced into one rating of the latest text.
+
+    :param comment_id: The ID of comment to rate.
+    :type comment_id: int
+    :param db: The database session.
+    :type db: AsyncSession
+    :param delay: Time to wait before rating.
+    :type delay: timedelta | None
+    """
+    run_at = func.now() + delay if delay else func.now()
+    sq = pg_insert(EmometerJob).values(comment_id=comment_id, run_at=run_at)
+    sq = sq.on_conflict_do_update(
+        index_elements=[EmometerJob.comment_id],
+        set_={
+            "run_at": sq.excluded.run_at,
+            "locked_until": None,
+            "attempts": 0,
+            "last_error": None,
+        },
+    )
+    await db.execute(sq)
+
+
+async def emometer_job_cancel(comment_id: int, db: AsyncSession) -> None:
+    """
+    Removes queued job of comment, like when rates of its new text are known.
+    Nothing is committed here.
+    """
+    sq = delete(EmometerJob).where(EmometerJob.comment_id == comment_id)
+    await db.execute(sq)
+
+
+async def emometer_jobs_claim(limit: int, db: AsyncSession) -> List[tuple]:
+    """
+    Leases due jobs for config.emometer_lease seconds and reads text of their
+    comments by one statement. Locked rows are skipped, so several workers
+    never claim the same job, and the lease is committed at once, so no lock
+    is held while comments are rated.
+
+    :param limit: Maximal amount of claimed jobs.
+    :type limit: int
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: Comment ID, image ID, comment revision and comment text of each
+             claimed job.
+    :rtype: List[tuple]
+    """
+    due = (
+        select(EmometerJob.id)
+        .filter(
+            EmometerJob.run_at <= func.now(),
+            or_(
+                EmometerJob.locked_until.is_(None),
+                EmometerJob.locked_until <= func.now(),
+            ),
+            EmometerJob.attempts < config.emometer_max_attempts,
+        )
+        .order_by(EmometerJob.run_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    sq = (
+        update(EmometerJob)
+        .where(EmometerJob.id.in_(due.scalar_subquery()))
+        .where(EmometerJob.comment_id == Comment.id)
+        .values(locked_until=func.now() + timedelta(seconds=config.emometer_lease))
+        .returning(Comment.id, Comment.image_id, Comment.revision, Comment.comment)
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(sq)
+    jobs = result.all()
+    await db.commit()
+    return jobs
+
+
+async def emometer_jobs_done(
+    revisions: Dict[int, int], scores: Dict[int, tuple], error: str, db: AsyncSession
+) -> tuple[List[int], int, int]:
+    """
+    Stores emotion rates and removes their jobs, and postpones failed jobs
+    with exponential backoff, all in one transaction. Results of comments
+    which are edited since claim are dropped, and their jobs are left to
+    rate the new text.
+
+    :param revisions: Revisions of claimed comments by comment ID.
+    :type revisions: Dict[int, int]
+    :param scores: Rates (joy, anger, sadness, surprise, disgust, fear)
+                   by comment ID.
+    :type scores: Dict[int, tuple]
+    :param error: Reason of failure of comments which are not rated.
+    :type error: str
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: IDs of comments with stored rates, amount of dropped stale
+             results and amount of jobs which became dead after this failure.
+    :rtype: tuple[List[int], int, int]
+    """
+    sq = (
+        select(Comment.id)
+        .where(tuple_(Comment.id, Comment.revision).in_(list(revisions.items())))
+        .order_by(Comment.id)
+        .with_for_update(of=Comment)
+    )
+    result = await db.execute(sq)
+    fresh = set(result.scalars())
+    scores = {id: rates for id, rates in scores.items() if id in fresh}
+    failed = [id for id in fresh if id not in scores]
+
+    dead = 0
+    if scores:
+        await update_emometer(scores, db)
+        sq = delete(EmometerJob).where(EmometerJob.comment_id.in_(list(scores)))
+        await db.execute(sq)
+    if failed:
+        backoff = func.least(
+            config.emometer_backoff * func.power(2, EmometerJob.attempts),
+            config.emometer_backoff_max,
+        )
+        sq = (
+            update(EmometerJob)
+            .where(EmometerJob.comment_id.in_(failed))
+            .values(
+                attempts=EmometerJob.attempts + 1,
+                last_error=error,
+                locked_until=None,
+                run_at=func.now() + func.make_interval(0, 0, 0, 0, 0, 0, backoff),
+            )
+            .returning(EmometerJob.attempts)
+            .execution_options(synchronize_session=False)
+        )
+        result = await db.execute(sq)
+        dead = sum(
+            attempts >= config.emometer_max_attempts for attempts in result.scalars()
+        )
+    await db.commit()
+    return list(scores), len(revisions) - len(fresh), dead
+
+
+async def emometer_jobs_stats(db: AsyncSession) -> dict:
+    """
+    Counts queued jobs by state and measures queue lag, i.e. how long
+    the oldest due job is waiting for a worker.
+    """
+    dead = EmometerJob.attempts >= config.emometer_max_attempts
+    running = EmometerJob.locked_until > func.now()
+    due = EmometerJob.run_at <= func.now()
+    waiting = ~dead & ~running.is_(True)
+    sq = select(
+        func.count(EmometerJob.id).filter(waiting & due),
+        func.count(EmometerJob.id).filter(waiting & ~due),
+        func.count(EmometerJob.id).filter(~dead & running),
+        func.count(EmometerJob.id).filter(dead),
+        func.extract(
+            "epoch", func.now() - func.min(EmometerJob.run_at).filter(waiting & due)
+        ),
+    )
+    result = await db.execute(sq)
+    due, scheduled, running, dead, lag = result.one()
+    return {
+        "due": due,
+        "scheduled": scheduled,
+        "running": running,
+        "dead": dead,
+        "lag_seconds": float(lag or 0),
+    }
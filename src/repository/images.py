@@ -4,19 +4,44 @@ from sqlalchemy import (
     select,
     delete,
     insert,
+    update,
     text,
     func,
+    literal,
     and_,
     or_,
+    tuple_,
+    true,
+    values,
+    column,
+    SmallInteger,
+    String,
 )
-
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-
-
-from src.database.models import Image, Comment, tag_m2m_image, Tag, User, Role
+from typing import List
+
+
+from src.database.models import (
+    AssetDeletion,
+    Image,
+    ImageVariant,
+    Comment,
+    Star,
+    tag_m2m_image,
+    Tag,
+    User,
+    Role,
+)
+from src.repository.assets import asset_deletion_enqueue
 from src.schemas import ImageAboutUpdateSchema
 # from src.repository.admin import (check_permission,)
 
+# Limit of tags of one image, see slot of tag_m2m_image
+MAX_IMAGE_TAGS = 5
+# Attempts of tag assignment which lose a slot to concurrent requests
+TAG_SLOT_RETRIES = 5
+
 
 async def image_create(
     image_url: str,
@@ -25,6 +50,8 @@ async def image_create(
     cloud_version: str,
     user: User,
     db: AsyncSession,
+    original_size: int | None = None,
+    stored_size: int | None = None,
 ) -> Image:
     """
     Creates a new image for a specific user.
@@ -41,6 +68,10 @@ async def image_create(
     :type user: User
     :param db: The database session.
     :type db: AsyncSession
+    :param original_size: Size of uploaded file in bytes.
+    :type original_size: int | None
+    :param stored_size: Size of stored (re-encoded) file in bytes.
+    :type stored_size: int | None
     :return: The newly created image.
     :rtype: Image
     """
@@ -50,6 +81,8 @@ async def image_create(
         cloud_public_id=cloud_public_id,
         cloud_version=cloud_version,
         user_id=user.id,
+        original_size=original_size,
+        stored_size=stored_size,
     )
     db.add(image)
     await db.commit()
@@ -57,6 +90,51 @@ async def image_create(
     return image
 
 
+async def images_create(records: List[dict], user: User, db: AsyncSession) -> List[Image]:
+    """
+    Creates many images for a specific user by one INSERT ... RETURNING
+    statement in one transaction. Records with cloud_public_id of already
+    stored images are skipped. Skipped assets which no stored image refers
+    to are enqueued for deletion in the same transaction.
+
+    :param records: Image fields (image, small_image, cloud_public_id,
+                    cloud_version, original_size, stored_size) of each
+                    uploaded image.
+    :type records: List[dict]
+    :param user: The user to create the images for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: The newly created images.
+    :rtype: List[Image]
+    """
+    if not records:
+        return []
+    sq = (
+        pg_insert(Image)
+        .values([{**record, "user_id": user.id} for record in records])
+        .on_conflict_do_nothing(index_elements=[Image.cloud_public_id])
+        .returning(Image)
+    )
+    result = await db.scalars(sq)
+    images = result.all()
+
+    stored = {image.cloud_public_id for image in images}
+    skipped = [
+        record["cloud_public_id"]
+        for record in records
+        if record["cloud_public_id"] not in stored
+    ]
+    if skipped:
+        sq = select(Image.cloud_public_id).filter(Image.cloud_public_id.in_(skipped))
+        referenced = set((await db.scalars(sq)).all())
+        await asset_deletion_enqueue(
+            [public_id for public_id in skipped if public_id not in referenced], db
+        )
+    await db.commit()
+    return images
+
+
 async def image_about_update(
     body: ImageAboutUpdateSchema, user: User, db: AsyncSession
 ) -> Image:
@@ -86,60 +164,107 @@ async def image_about_update(
     return image
 
 
+def editable_image(image_id: int, user: User):
+    """
+    Query of ID of image which user may change: owner, admin or moderator.
+
+    :param image_id: The ID of image.
+    :type image_id: int
+    :param user: The user who changes image.
+    :type user: User
+    :return: Select of image ID, empty if image is not accessible.
+    :rtype: Select
+    """
+    sq = select(Image.id).filter(Image.id == image_id)
+    if user.role not in (Role.admin, Role.moder):
+        sq = sq.filter(Image.user_id == user.id)
+    return sq
+
+
 async def image_add_tag(
     image_id: int, tag_name: str, user: User, db: AsyncSession
 ):
     """
     Add tag to image for a specific owner.
-    """
-    sq = select(Image).filter(and_(Image.id == image_id,
-                                   or_(user.role == Role.admin,
-                                       user.role == Role.moder,
-                                       Image.user_id == user.id)))
-    result = await db.execute(sq)
-    image = result.scalar_one_or_none()
-
-    if image is None:
-        return (status.HTTP_404_NOT_FOUND, "Image is not accessible.")
-
-    sq = select(Tag).filter(func.lower(Tag.name) == func.lower(tag_name))
-    result = await db.execute(sq)
-    await db.commit()
-    tag = result.first()
 
-    if tag is None:
-        return (status.HTTP_404_NOT_FOUND, "Tag is not exists.")
+    Access check, tag lookup, limit check and insert are done by one
+    statement. The tag takes the lowest free slot of image, and slots are
+    unique per image, so concurrent requests cannot assign more than
+    MAX_IMAGE_TAGS tags. A request which loses a slot to a concurrent one
+    is repeated with a fresh snapshot, up to TAG_SLOT_RETRIES times.
 
-    tag = tag[0]
-    # print(f"   [D] tag: {tag.id}, {tag.name}")
-    sq = select(tag_m2m_image).where(tag_m2m_image.c.image_id == image.id)
-    result = await db.execute(sq)
-    await db.commit()
-    tags = result.all()
-    # print(f"    [D] tags='{tags}'")
-    # output: [(5, 9, 7), (6, 9, 3), (7, 9, 4), (8, 9, 8)]
-
-    for tg in tags:
-        if tg[2] == tag.id:
+    :param image_id: The ID of image.
+    :type image_id: int
+    :param tag_name: The name of tag, it is case insensitive.
+    :type tag_name: str
+    :param user: The user who changes image.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: 0 and tag names of image, or HTTP status and error message.
+    :rtype: tuple
+    """
+    for _ in range(TAG_SLOT_RETRIES):
+        image = editable_image(image_id, user).cte("image")
+        tag = (
+            select(Tag.id, Tag.name)
+            .filter(func.lower(Tag.name) == func.lower(tag_name))
+            .cte("tag")
+        )
+        slot = func.generate_series(1, MAX_IMAGE_TAGS).column_valued("slot")
+        taken = select(tag_m2m_image.c.slot).filter(
+            tag_m2m_image.c.image_id == image_id, tag_m2m_image.c.slot.is_not(None)
+        )
+        free = select(func.min(slot).label("slot")).filter(slot.not_in(taken))
+        free = free.cte("free")
+        assigned = (
+            pg_insert(tag_m2m_image)
+            .from_select(
+                ["image_id", "tag_id", "slot"],
+                select(image.c.id, tag.c.id, free.c.slot)
+                .select_from(image.join(tag, true()).join(free, true()))
+                .filter(free.c.slot.is_not(None)),
+            )
+            .on_conflict_do_nothing()
+            .returning(tag_m2m_image.c.tag_id)
+            .cte("assigned")
+        )
+        names = (
+            select(
+                func.array_agg(
+                    aggregate_order_by(
+                        Tag.name, tag_m2m_image.c.slot.nulls_last(), tag_m2m_image.c.id
+                    )
+                )
+            )
+            .join(tag_m2m_image, tag_m2m_image.c.tag_id == Tag.id)
+            .filter(tag_m2m_image.c.image_id == image_id)
+        )
+        sq = select(
+            select(func.count()).select_from(image).scalar_subquery(),
+            select(tag.c.name).scalar_subquery(),
+            select(func.count()).select_from(assigned).scalar_subquery(),
+            select(free.c.slot).scalar_subquery(),
+            names.scalar_subquery(),
+        )
+        result = await db.execute(sq)
+        await db.commit()
+        accessible, name, inserted, free_slot, tags = result.one()
+        tags = tags or []
+
+        if not accessible:
+            return (status.HTTP_404_NOT_FOUND, "Image is not accessible.")
+        if name is None:
+            return (status.HTTP_404_NOT_FOUND, "Tag is not exists.")
+        if name in tags:
             return (status.HTTP_409_CONFLICT, "Already exists.")
-
-    if len(tags) >= 5:
-        return (status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
-                "More than 5 tags are not allowed.")
-
-    sq = insert(tag_m2m_image).values(image_id=image.id, tag_id=tag.id)
-    # print(f"    [D] sq='{sq}'")
-    await db.execute(sq)
-    await db.commit()
-    tag_ids = [tg[2] for tg in tags]
-    tag_ids.append(tag.id)
-    sq = select(Tag).filter(Tag.id.in_(tag_ids))
-    print(f"    [D2] sq='{sq}'")
-    result = await db.execute(sq)
-    await db.commit()
-    tags = result.all()
-    # print(f"    [D3] tags='{tags}'")
-    return (0, [tg[0].name for tg in tags])
+        if free_slot is None:
+            return (status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                    "More than 5 tags are not allowed.")
+        if inserted:
+            # The statement snapshot does not contain its own insert
+            return (0, tags + [name])
+    return (status.HTTP_409_CONFLICT, "Tags of image are changed concurrently.")
 
 
 async def image_remove_tag(image_id: int, tag_name: str,
@@ -181,9 +306,164 @@ async def image_remove_tag(image_id: int, tag_name: str,
     return (0, "Tag successfully removed.")
 
 
-async def image_delete(image_id: int, user: User, db: AsyncSession) -> Image | None:
+async def image_set_tags(
+    image_id: int, tag_names: List[str], create_missing: bool,
+    user: User, db: AsyncSession
+):
+    """
+    Replaces all tags of image for a specific owner in one transaction.
+
+    Current tags are compared with the requested ones, so only the
+    difference is written: one delete of tags which are not requested and
+    one multi-row insert of new tags into free slots. When a concurrent
+    request takes a slot meanwhile, the change is rolled back and repeated,
+    up to TAG_SLOT_RETRIES times.
+
+    :param image_id: The ID of image.
+    :type image_id: int
+    :param tag_names: Names of all tags of image, up to MAX_IMAGE_TAGS
+                      names which are unique case insensitively.
+    :type tag_names: List[str]
+    :param create_missing: Create tags which do not exist yet.
+    :type create_missing: bool
+    :param user: The user who changes image.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: 0 and tag names of image, added and removed names, or HTTP
+             status and error message.
+    :rtype: tuple
+    """
+    lowered = [name.lower() for name in tag_names]
+    # Built once: rollback of a lost attempt expires the user object
+    image = editable_image(image_id, user)
+    for _ in range(TAG_SLOT_RETRIES):
+        result = await db.execute(image)
+        if result.scalar_one_or_none() is None:
+            await db.rollback()
+            return (status.HTTP_404_NOT_FOUND, "Image is not accessible.")
+
+        if create_missing and tag_names:
+            names = values(column("name", String), name="names").data(
+                [(name,) for name in tag_names]
+            )
+            known = select(Tag.id).filter(
+                func.lower(Tag.name) == func.lower(names.c.name)
+            )
+            sq = (
+                pg_insert(Tag)
+                .from_select(["name"], select(names.c.name).filter(~known.exists()))
+                .on_conflict_do_nothing()
+            )
+            await db.execute(sq)
+
+        sq = select(Tag.id, Tag.name).filter(func.lower(Tag.name).in_(lowered))
+        result = await db.execute(sq)
+        tags = {name.lower(): (tag_id, name) for tag_id, name in result.all()}
+        missing = [name for name in tag_names if name.lower() not in tags]
+        if missing:
+            await db.rollback()
+            return (status.HTTP_404_NOT_FOUND,
+                    f"Tags are not exist: {', '.join(missing)}.")
+        wanted = {tags[name][0]: tags[name][1] for name in lowered}
+
+        sq = (
+            delete(tag_m2m_image)
+            .filter(tag_m2m_image.c.image_id == image_id,
+                    tag_m2m_image.c.tag_id.not_in(list(wanted)),
+                    tag_m2m_image.c.tag_id == Tag.id)
+            .returning(Tag.name)
+        )
+        result = await db.execute(sq)
+        removed = list(result.scalars())
+
+        sq = select(tag_m2m_image.c.tag_id, tag_m2m_image.c.slot).filter(
+            tag_m2m_image.c.image_id == image_id,
+            tag_m2m_image.c.tag_id.in_(list(wanted)),
+        )
+        result = await db.execute(sq)
+        kept = dict(result.all())
+        free = sorted(set(range(1, MAX_IMAGE_TAGS + 1)) - set(kept.values()))
+        rows = [
+            {"image_id": image_id, "tag_id": tag_id, "slot": slot}
+            for tag_id, slot in zip([id for id in wanted if id not in kept], free)
+        ]
+        if rows:
+            sq = (
+                pg_insert(tag_m2m_image)
+                .values(rows)
+                .on_conflict_do_nothing()
+                .returning(tag_m2m_image.c.tag_id)
+            )
+            result = await db.execute(sq)
+            if len(result.all()) < len(rows):
+                # A concurrent request has taken a slot or assigned a tag
+                await db.rollback()
+                continue
+        await db.commit()
+
+        slots = {**kept, **{row["tag_id"]: row["slot"] for row in rows}}
+        order = sorted(slots, key=lambda tag_id: slots[tag_id] or MAX_IMAGE_TAGS + 1)
+        return (0, {
+            "image_id": image_id,
+            "tags": [wanted[tag_id] for tag_id in order],
+            "added": [wanted[row["tag_id"]] for row in rows],
+            "removed": removed,
+        })
+    return (status.HTTP_409_CONFLICT, "Tags of image are changed concurrently.")
+
+
+async def images_delete(
+    image_ids: List[int], user: User, db: AsyncSession
+) -> List[int]:
+    """
+    Deletes many images of a specific owner (or any images for admin and
+    moderator) by one DELETE ... RETURNING, which also enqueues Cloudinary
+    assets of deleted images for background deletion. Comments, stars,
+    tags, variants and emotion stats are removed by cascading foreign keys.
+
+    :param image_ids: IDs of images to delete.
+    :type image_ids: List[int]
+    :param user: The user to delete the images for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: IDs of deleted images. Absent and not accessible images are
+             skipped.
+    :rtype: List[int]
+    """
+    sq = delete(Image).filter(Image.id.in_(image_ids))
+    if user.role not in (Role.admin, Role.moder):
+        sq = sq.filter(Image.user_id == user.id)
+    deleted = sq.returning(Image.id, Image.cloud_public_id).cte("deleted")
+    # Python-side column defaults are not applied to INSERT CTEs of one
+    # statement, so every NOT NULL column is set explicitly
+    enqueued = (
+        insert(AssetDeletion)
+        .from_select(
+            ["cloud_public_id", "attempts", "next_attempt_at", "created_at"],
+            select(
+                deleted.c.cloud_public_id,
+                literal(0, SmallInteger).label("attempts"),
+                func.now().label("next_attempt_at"),
+                func.now().label("created_at"),
+            ),
+            include_defaults=False,
+        )
+        .cte("enqueued")
+    )
+    sq = select(deleted.c.id).add_cte(enqueued).order_by(deleted.c.id)
+    result = await db.execute(sq)
+    deleted_ids = list(result.scalars())
+    await db.commit()
+    return deleted_ids
+
+
+async def image_delete(image_id: int, user: User, db: AsyncSession) -> int | None:
     """
     Delete a single image with the specified ID for a specific user.
+    Cloudinary asset of the image is enqueued for background deletion
+    by the same statement.
 
     :param image_id: The ID of the image to delete.
     :type image_id: int
@@ -191,24 +471,85 @@ async def image_delete(image_id: int, user: User, db: AsyncSession) -> Image | N
     :type user: User
     :param db: The database session.
     :type db: AsyncSession
-    :return: The deleted contact, or None if it does not exist.
-    :rtype: Image | None
+    :return: The ID of deleted image, or None if it does not exist.
+    :rtype: int | None
     """
-    sq = select(Image).filter(and_(Image.id == image_id,
-                                   or_(user.role == Role.admin,
-                                       user.role == Role.moder,
-                                       Image.user_id == user.id)))
+    deleted_ids = await images_delete([image_id], user, db)
+    return deleted_ids[0] if deleted_ids else None
+
+
+async def images_counters_repair(db: AsyncSession) -> int:
+    """
+    Recounts comments and stars of all images by one aggregate query and
+    fixes counters of images where they differ.
+
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: Amount of fixed images.
+    :rtype: int
+    """
+    comments = (
+        select(Comment.image_id, func.count(Comment.id).label("count"))
+        .group_by(Comment.image_id)
+        .subquery()
+    )
+    stars = (
+        select(
+            Star.image_id,
+            func.count(Star.id).label("count"),
+            func.sum(Star.level).label("sum"),
+        )
+        .group_by(Star.image_id)
+        .subquery()
+    )
+    actual = (
+        select(
+            Image.id,
+            func.coalesce(comments.c.count, 0).label("comment_count"),
+            func.coalesce(stars.c.count, 0).label("star_count"),
+            func.coalesce(stars.c.sum, 0).label("star_sum"),
+        )
+        .outerjoin(comments, comments.c.image_id == Image.id)
+        .outerjoin(stars, stars.c.image_id == Image.id)
+        .subquery()
+    )
+    sq = (
+        update(Image)
+        .where(Image.id == actual.c.id)
+        .where(
+            tuple_(Image.comment_count, Image.star_count, Image.star_sum)
+            != tuple_(actual.c.comment_count, actual.c.star_count, actual.c.star_sum)
+        )
+        .values(
+            comment_count=actual.c.comment_count,
+            star_count=actual.c.star_count,
+            star_sum=actual.c.star_sum,
+            updated_at=Image.updated_at,
+        )
+        .execution_options(synchronize_session=False)
+    )
     result = await db.execute(sq)
-    image = result.scalar_one_or_none()
+    await db.commit()
+    return result.rowcount
 
-    if image:
-        # Delete comment for suitable image
-        sq = delete(Comment).where(Comment.image_id == image.id)
-        await db.execute(sq)
-        # Delete suitable image
-        await db.delete(image)
-        await db.commit()
-    return image
+
+async def images_upload_savings(db: AsyncSession) -> dict:
+    """
+    Sums sizes of uploaded and stored files of all images with known sizes.
+    """
+    sq = select(
+        func.count(Image.id),
+        func.coalesce(func.sum(Image.original_size), 0),
+        func.coalesce(func.sum(Image.stored_size), 0),
+    ).filter(Image.original_size.is_not(None), Image.stored_size.is_not(None))
+    result = await db.execute(sq)
+    images, original_bytes, stored_bytes = result.one()
+    return {
+        "images": images,
+        "original_bytes": original_bytes,
+        "stored_bytes": stored_bytes,
+        "saved_bytes": original_bytes - stored_bytes,
+    }
 
 
 async def image_read(id: int, db: AsyncSession) -> Image:
@@ -258,7 +599,10 @@ async def image_search(
             to_date = from_date + timedelta(days=1)
     tags_amount = len(tags)
     ## list of searched fields ##
-    only_fields = "im.id, im.small_image, im.about"
+    only_fields = (
+        "im.id, im.small_image, im.about, "
+        "im.comment_count, im.star_count, im.star_sum"
+    )
     ##
     if tags_amount:
         sq = text(
@@ -334,20 +678,57 @@ async def image_exists(image_id: int, user: User, db: AsyncSession) -> Image:
     return image
 
 
-async def update_image_url(
-    image_id: int, crop_image_url, user: User, db: AsyncSession
-) -> Image:
-    sq = select(Image).filter(
-        and_(
-            Image.id == image_id,
-            Image.user_id == user.id,
+async def images_owned(
+    image_ids: List[int], user: User, db: AsyncSession
+) -> List[tuple]:
+    """
+    Reads urls of the user's images from the ID list by one query.
+
+    :return: ID and url of each found image, in order of image_ids.
+    :rtype: List[tuple]
+    """
+    sq = select(Image.id, Image.image).filter(
+        Image.id.in_(image_ids), Image.user_id == user.id
+    )
+    result = await db.execute(sq)
+    urls = dict(result.all())
+    return [(id, urls[id]) for id in dict.fromkeys(image_ids) if id in urls]
+
+
+async def image_variant_read(
+    image_id: int, width: int, height: int, crop: str, db: AsyncSession
+) -> tuple | None:
+    """
+    Reads stored transformation url of image.
+
+    :return: Url of image variant and ID of image owner, or None if variant
+             is not stored yet.
+    :rtype: tuple | None
+    """
+    sq = (
+        select(ImageVariant.url, Image.user_id)
+        .join(Image, Image.id == ImageVariant.image_id)
+        .filter(
+            ImageVariant.image_id == image_id,
+            ImageVariant.width == width,
+            ImageVariant.height == height,
+            ImageVariant.crop == crop,
         )
     )
     result = await db.execute(sq)
-    image = result.scalar_one_or_none()
+    return result.first()
 
-    if image:
-        image.image = crop_image_url
-        image.updated_at = datetime.now()
-        await db.commit()
-    return image
+
+async def image_variant_create(
+    image_id: int, width: int, height: int, crop: str, url: str, db: AsyncSession
+) -> None:
+    """
+    Stores transformation url of image. Already stored variant is kept as is.
+    """
+    sq = (
+        pg_insert(ImageVariant)
+        .values(image_id=image_id, width=width, height=height, crop=crop, url=url)
+        .on_conflict_do_nothing()
+    )
+    await db.execute(sq)
+    await db.commit()
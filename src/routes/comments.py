@@ -1,119 +1,92 @@
-from fastapi import APIRouter, Depends, HTTPException, Path
-import openai
+import asyncio
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, status
+from fastapi import WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-import re
 
 
+from src.conf.config import config
 from src.database.connect import get_db
-from src.database.models import Comment, Image, User
+from src.database.models import Comment, User, Role
 from src.schemas import (
     ReturnMessageResponseSchema,
+    CommentBulkDeleteSchema,
+    CommentBulkDeleteResponseSchema,
     CommentDb,
     CommentShowAllSchema,
     CommentUpdateSchema,
+    EmometerQueueStatsSchema,
+    ImageEmotionsSchema,
 )
-from starlette.background import BackgroundTasks
 
 
-from src.conf.config import config
 from src.services.auth import auth_service
+from src.services.emo_cache import emo_cache
+from src.services.events import comment_events
+from src.services.pagination import encode_cursor, decode_cursor
+from src.services.roles import RoleChecker
 from src.repository import comments as repository_comments
+from src.repository import emometer as repository_emometer
+from src.repository.emometer import EMO_FIELDS
 
 router = APIRouter(prefix="/comments", tags=["comments"])
 
-openai.api_key = config.gpt_api_key
-
-
-emo_joy = re.compile(r"^.*?<\(@.*?joy.+?(\d{1,3})\s*\%", re.I|re.M)
-emo_anger = re.compile(r"^.*?<\(@.*?anger.+?(\d{1,3})\s*\%", re.I|re.M)
-emo_sadness = re.compile(r"^.*?<\(@.*?sadness.+?(\d{1,3})\s*\%", re.I|re.M)
-emo_surprise = re.compile(r"^.*?<\(@.*?surprise.+?(\d{1,3})\s*\%", re.I|re.M)
-emo_disgust = re.compile(r"^.*?<\(@.*?disgust.+?(\d{1,3})\s*\%", re.I|re.M)
-emo_fear = re.compile(r"^.*?<\(@.*?fear.+?(\d{1,3})\s*\%", re.I|re.M)
-
-async def emometer(comment: str, comment_id: int, db: AsyncSession):
-    template = "Imagine that you show emotions of joy, anger, sadness, " \
-        "surprise, disgust, and fear of people in messages which are " \
-        "quoted with \"&&&\" sequence. Rate the following messages in " \
-        "percentage of each emotion. Each rate must start with \"<(@\" "\
-        "sequence and end with \"@)>\". Here is the list of my messages:"
-    comments = [comment]
-    request = ""
-    i = 1
-    for com in comments:
-        request += "\n" + f"{i}. &&&{com}&&&."
-        i += 1
-    request = template + request
-    # models = openai.Model.list()
-    chat_completion = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": request}])
-    answ: str = chat_completion.choices[0].message.content
-
-    joy, anger, sadness, surprise, disgust, fear = 0, 0, 0, 0, 0, 0
-
-    m = emo_joy.search(answ)
-    if m:
-        joy = int(m.group(1))
-    m = emo_anger.search(answ)
-    if m:
-        anger = int(m.group(1))
-    m = emo_sadness.search(answ)
-    if m:
-        sadness = int(m.group(1))
-    m = emo_surprise.search(answ)
-    if m:
-        surprise = int(m.group(1))
-    m = emo_disgust.search(answ)
-    if m:
-        disgust = int(m.group(1))
-    m = emo_fear.search(answ)
-    if m:
-        fear = int(m.group(1))
-    await repository_comments.update_emometer(
-        joy, anger, sadness, surprise, disgust, fear,
-        comment_id, db
-    )
-
 
 @router.post("/", response_model=CommentDb)
 async def create_comment_for_image(
     image_id: int,
     comment: str,
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(auth_service.get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    image = await db.get(Image, image_id)
-    if not image:
+    rates = await emo_cache.get(comment)
+    new_comment: Comment = await repository_comments.create_comment(
+        comment, current_user.id, image_id, db, rates
+    )
+    if new_comment is None:
         raise HTTPException(
             status_code=404,
             detail="Image not found or doesn't belong to the current user",
         )
 
-    new_comment: Comment = await repository_comments.create_comment(
-        comment, current_user.id, image_id, db
+    await comment_events.publish(
+        image_id,
+        {
+            "type": "created",
+            "comment": {
+                **CommentDb.model_validate(new_comment).model_dump(),
+                "username": current_user.username,
+                "avatar": current_user.avatar,
+            },
+        },
     )
-
-    if new_comment:
-        background_tasks.add_task(emometer, comment, new_comment.id, db)
-
     return new_comment
 
 
 @router.put("/", response_model=CommentUpdateSchema)
 async def update_comment_for_image(
     body: CommentUpdateSchema,
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(auth_service.get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    updated_comment = await repository_comments.update_comment(body, current_user, db)
+    rates = await emo_cache.get(body.comment)
+    updated_comment, changed = await repository_comments.update_comment(
+        body, current_user, db, rates
+    )
 
     if updated_comment:
-        background_tasks.add_task(emometer,
-                                  updated_comment.comment,
-                                  updated_comment.id, db)
+        if changed:
+            await comment_events.publish(
+                updated_comment.image_id,
+                {
+                    "type": "updated",
+                    "comment_id": updated_comment.id,
+                    "comment": updated_comment.comment,
+                    **dict(zip(EMO_FIELDS, rates or ())),
+                },
+            )
         return {
             "comment_id": updated_comment.id,
             "image_id": updated_comment.image_id,
@@ -127,11 +100,37 @@ async def update_comment_for_image(
     )
 
 
+@router.get(
+    "/stats/queue",
+    response_model=EmometerQueueStatsSchema,
+    dependencies=[Depends(RoleChecker([Role.admin, Role.moder]))],
+)
+async def emometer_queue_stats(db: AsyncSession = Depends(get_db)):
+    """
+    Reports state of the emotion rating queue: amounts of due, scheduled
+    (postponed), running and dead jobs, and lag of the oldest due job
+    in seconds.
+    """
+    return await repository_emometer.emometer_jobs_stats(db)
+
+
 @router.get("/images/{image_id}/comments/", response_model=CommentShowAllSchema)
-async def get_comments_for_image(image_id: int, db: AsyncSession = Depends(get_db)):
-    comments = await repository_comments.get_comments_for_image(image_id, db)
+async def get_comments_for_image(
+    image_id: int,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: str | None = Query(None, description="next_cursor of previous page"),
+    db: AsyncSession = Depends(get_db),
+):
+    after = decode_cursor(cursor) if cursor else None
+    comments = await repository_comments.get_comments_for_image(
+        image_id, db, limit + 1, after
+    )
     if comments:
-        return {"comments": comments}
+        next_cursor = None
+        if len(comments) > limit:
+            comments = comments[:limit]
+            next_cursor = encode_cursor(comments[-1].created_at, comments[-1].id)
+        return {"comments": comments, "next_cursor": next_cursor}
 
     raise HTTPException(
         status_code=404,
@@ -139,6 +138,101 @@ async def get_comments_for_image(image_id: int, db: AsyncSession = Depends(get_d
     )
 
 
+@router.get("/images/{image_id}/events")
+async def stream_comment_events(
+    request: Request,
+    image_id: int = Path(description="The ID of image", ge=1),
+):
+    """
+    Streams events of comments of image as Server-Sent Events: "created",
+    "updated", "deleted" and "rated" (new emotion rates). A client which
+    does not keep up gets "overflow" event and must reload the thread.
+    """
+
+    async def stream():
+        with comment_events.subscribe(image_id) as subscription:
+            while not await request.is_disconnected():
+                event = await subscription.get(config.events_heartbeat)
+                if event is None:
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                if event["type"] == "overflow":
+                    break
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/images/{image_id}/stream")
+async def stream_comment_events_ws(websocket: WebSocket, image_id: int):
+    """
+    Streams events of comments of image by WebSocket, the same events as
+    stream_comment_events sends, as JSON messages. "ping" is sent when there
+    are no events, and the connection is closed when the client does not
+    keep up.
+    """
+    await websocket.accept()
+    try:
+        with comment_events.subscribe(image_id) as subscription:
+            while True:
+                event = await subscription.get(config.events_heartbeat)
+                await asyncio.wait_for(
+                    websocket.send_json(event or {"type": "ping"}),
+                    config.events_send_timeout,
+                )
+                if event and event["type"] == "overflow":
+                    break
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+    except asyncio.TimeoutError:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+    except WebSocketDisconnect:
+        pass
+
+
+@router.get("/images/{image_id}/emotions", response_model=ImageEmotionsSchema)
+async def get_emotions_for_image(
+    image_id: int = Path(description="The ID of image", ge=1),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Reports average emotion rates of rated comments of image. They are read
+    from incrementally maintained stats, without reading the comments.
+    """
+    return await repository_emometer.image_emotion_stats_read(image_id, db)
+
+
+@router.post(
+    "/bulk/delete",
+    response_model=CommentBulkDeleteResponseSchema,
+    dependencies=[Depends(RoleChecker([Role.admin, Role.moder]))],
+)
+async def delete_comments_bulk(
+    body: CommentBulkDeleteSchema,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Deletes many comments at once, like a spam wave: by ID list, by author,
+    or by image, optionally within creation time window [created_from,
+    created_to). All given conditions must match. Counters and emotion stats
+    of images are updated by the same statement.
+    """
+    comments = await repository_comments.delete_comments_bulk(body, db)
+    await comment_events.publish_many(
+        [
+            (image_id, {"type": "deleted", "comment_id": comment_id})
+            for comment_id, image_id in comments
+        ]
+    )
+    return {
+        "deleted": len(comments),
+        "comment_ids": [comment_id for comment_id, _ in comments],
+    }
+
+
 @router.delete("/{comment_id}", response_model=ReturnMessageResponseSchema)
 async def delete_comment_for_image(
     comment_id: int = Path(description="The ID of comment to delete", ge=1),
@@ -150,6 +244,9 @@ async def delete_comment_for_image(
     )
 
     if deleted_comment:
+        await comment_events.publish(
+            deleted_comment.image_id, {"type": "deleted", "comment_id": comment_id}
+        )
         return {"message": f"Comment with ID {comment_id} is successfully deleted."}
     else:
         raise HTTPException(
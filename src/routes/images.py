@@ -1,3 +1,6 @@
+import asyncio
+import logging
+
 import cloudinary
 import cloudinary.uploader
 
@@ -8,19 +11,26 @@ from fastapi import (
     Depends,
     File,
     HTTPException,
+    Request,
+    Response,
     status,
     UploadFile,
 )
-from fastapi import Path
+from fastapi import Path, Query
+from fastapi.responses import StreamingResponse
 from fastapi_limiter.depends import RateLimiter
-from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
+from src.conf import messages
 from src.conf.config import config
 from src.database.connect import get_db
-from src.database.models import User, Image
+from src.database.models import User, Image, Role
+from src.repository import assets as repository_assets
 from src.repository import images as repository_images
-from src.schemas import ImageDb
+from src.schemas import ImageDb, ImageBatchResponseSchema
+from src.schemas import ImageBatchDeleteSchema, ImageBatchDeleteResponseSchema
 
 from src.schemas import (
     ImageAboutUpdateSchema,
@@ -28,13 +38,34 @@ from src.schemas import (
     ReturnMessageResponseSchema,
     ImageReadResponseSchema,
     SmallImageReadResponseSchema,
+    AssetDeletionStatsSchema,
+    ImageVariantResponseSchema,
+    UploadSavingsStatsSchema,
+    QrBatchSchema,
+    ImageTagsSchema,
+    ImageTagsResponseSchema,
 )
 
 from src.services.auth import auth_service
-from src.services.qr import create_qr_code_and_upload
+from src.services.qr import (
+    QR_MEDIA_TYPES,
+    etag_matches,
+    qr_code,
+    qr_sheet,
+    qr_zip_stream,
+)
+from src.services.roles import RoleChecker
+from src.services.uploads import prepare_upload
+from src.services.variants import (
+    build_variant_url,
+    image_variant_url,
+    variant_cache_evict,
+)
 
 router = APIRouter(prefix="/images", tags=["images"])
 
+CROP_MODES = r"^(fill|fit|limit|pad|scale|thumb|crop)$"
+
 
 cloudinary.config(
     cloud_name=config.cloudinary_name,
@@ -44,6 +75,39 @@ cloudinary.config(
 )
 
 
+async def upload_image(file: UploadFile) -> dict:
+    """
+    Uploads an image file to Cloudinary without blocking the event loop.
+    The file is re-encoded before uploading when config.upload_processing is on.
+
+    :param file: An image file to upload.
+    :type file: UploadFile
+    :return: Image fields (image, small_image, cloud_public_id, cloud_version,
+             original_size, stored_size) of the uploaded image.
+    :rtype: dict
+    """
+    data, original_size = await prepare_upload(file)
+    cloud = await run_in_threadpool(
+        cloudinary.uploader.upload, data, overwrite=True
+    )
+    cloud_public_id = cloud.get("public_id")
+    cloud_version = cloud.get("version")
+    return {
+        "image": build_variant_url(cloud_public_id, cloud_version),
+        "small_image": build_variant_url(
+            cloud_public_id,
+            cloud_version,
+            config.small_image_size,
+            config.small_image_size,
+            "fill",
+        ),
+        "cloud_public_id": cloud_public_id,
+        "cloud_version": cloud_version,
+        "original_size": original_size,
+        "stored_size": len(data),
+    }
+
+
 @router.post("/", response_model=ImageDb)
 async def image_create(
     file: UploadFile = File(),
@@ -62,31 +126,98 @@ async def image_create(
     :return: New image record.
     :rtype: ImageDb
     :raises HTTPException:
-            This exception is raised when such image already exists.
+            This exception is raised when such image already exists,
+            or file is not a valid image.
     """
-    cloud = cloudinary.uploader.upload(file.file, overwrite=True)
-    # print(cloud)
-    # print(f"[u] version={cloud.get('version')}, public_id={cloud.get('public_id')}")
-    cloud_public_id = cloud.get("public_id")
-    cloud_version = cloud.get("version")
-    image_url = cloudinary.CloudinaryImage(cloud_public_id).build_url(
-        version=cloud_version
-    )
-    small_image_url = cloudinary.CloudinaryImage(cloud_public_id).build_url(
-        width=config.small_image_size,
-        height=config.small_image_size,
-        crop="fill",
-        version=cloud_version,
-    )
+    cloud = await upload_image(file)
     try:
         image = await repository_images.image_create(
-            image_url, small_image_url, cloud_public_id, cloud_version, current_user, db
+            cloud["image"],
+            cloud["small_image"],
+            cloud["cloud_public_id"],
+            cloud["cloud_version"],
+            current_user,
+            db,
+            cloud["original_size"],
+            cloud["stored_size"],
         )
     except IntegrityError:
+        await db.rollback()
+        await repository_assets.asset_deletions_add([cloud["cloud_public_id"]], db)
         raise HTTPException(status_code=400, detail="Image already exists")
     return image
 
 
+@router.post("/batch/", response_model=ImageBatchResponseSchema)
+async def images_create_batch(
+    files: List[UploadFile] = File(),
+    current_user: User = Depends(auth_service.get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Creates many images by current user at once.
+
+    Files are uploaded concurrently (no more than config.upload_concurrency
+    uploads at the same time) and all uploaded images are stored by one
+    insert. Result is reported per file, so failed files do not cancel
+    the successful ones.
+
+    :param files: Image files to upload.
+    :type files: List[UploadFile]
+    :param current_user: Current user.
+    :type current_user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: Upload result for each file in the same order.
+    :rtype: ImageBatchResponseSchema
+    :raises HTTPException:
+            This exception is raised when too many files are sent.
+    """
+    if len(files) > config.upload_batch_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"No more than {config.upload_batch_size} files are allowed.",
+        )
+    semaphore = asyncio.Semaphore(config.upload_concurrency)
+
+    async def upload(file: UploadFile) -> dict | str:
+        async with semaphore:
+            try:
+                return await upload_image(file)
+            except HTTPException as err:
+                return err.detail
+            except Exception as err:
+                logging.error(f"Upload of '{file.filename}' failed: {err}")
+                return "Upload failed."
+
+    clouds = await asyncio.gather(*(upload(file) for file in files))
+    uploaded = [cloud for cloud in clouds if isinstance(cloud, dict)]
+    not_stored = "Image already exists."
+    try:
+        images = await repository_images.images_create(uploaded, current_user, db)
+    except SQLAlchemyError as err:
+        # Uploaded assets are destroyed in background instead of orphaned
+        logging.error(f"Batch of {len(uploaded)} images is not stored: {err}")
+        await db.rollback()
+        await repository_assets.asset_deletions_add(
+            [cloud["cloud_public_id"] for cloud in uploaded], db
+        )
+        images, not_stored = [], "Image is not stored."
+    stored = {image.cloud_public_id: image for image in images}
+
+    results = []
+    for file, cloud in zip(files, clouds):
+        if isinstance(cloud, str):
+            results.append({"filename": file.filename, "error": cloud})
+        elif cloud["cloud_public_id"] in stored:
+            results.append(
+                {"filename": file.filename, "image": stored[cloud["cloud_public_id"]]}
+            )
+        else:
+            results.append({"filename": file.filename, "error": not_stored})
+    return {"images": results}
+
+
 @router.put("/", response_model=ImageAboutUpdateResponseSchema)
 async def image_about_update(
     body: ImageAboutUpdateSchema,
@@ -117,6 +248,38 @@ async def image_about_update(
     raise HTTPException(status_code=400, detail="None suitable image is.")
 
 
+@router.put("/tags/{image_id}", response_model=ImageTagsResponseSchema)
+async def image_set_tags(
+    body: ImageTagsSchema,
+    image_id: int = Path(description="The ID of image to tag", ge=1),
+    current_user: User = Depends(auth_service.get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Replaces all tags of image for a current image owner by one request.
+
+    :param body: Up to 5 tag names, and whether missing tags are created.
+    :type body: ImageTagsSchema
+    :param image_id: The ID of image to tag.
+    :type image_id: int
+    :param current_user: Current user.
+    :type current_user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: All tags of image, and tags which are added and removed.
+    :rtype: ImageTagsResponseSchema
+    :raises HTTPException:
+            This exception is raised when image is not accessible or tags
+            are not exist.
+    """
+    (code, res) = await repository_images.image_set_tags(
+        image_id, body.tags, body.create_missing, current_user, db
+    )
+    if code == 0:
+        return res
+    raise HTTPException(status_code=code, detail=res)
+
+
 @router.put("/{image_id}/{tag_name}")
 async def image_add_tag(
     image_id: int,
@@ -177,18 +340,76 @@ async def image_delete(
     :raises HTTPException:
             This exception is raised when image is absent.
     """
-    image: Image = await repository_images.image_delete(image_id, current_user, db)
-    if image is None:
+    deleted_id = await repository_images.image_delete(image_id, current_user, db)
+    if deleted_id is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Image is absent.",
         )
-    # print(f"[d] public_id={image.cloud_public_id} to delete")
-    # Destroy image in cloudinary too
-    cloudinary.uploader.destroy(image.cloud_public_id)
+    await variant_cache_evict([deleted_id])
     return {"message": f"Image with ID {image_id} is successfully deleted."}
 
 
+@router.post("/batch/delete", response_model=ImageBatchDeleteResponseSchema)
+async def images_delete(
+    body: ImageBatchDeleteSchema,
+    current_user: User = Depends(auth_service.get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Deletes many images of the current owner by one statement. Admins and
+    moderators may delete images of any user.
+
+    :param body: IDs of images to delete.
+    :type body: ImageBatchDeleteSchema
+    :param current_user: Current user.
+    :type current_user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: Amount and IDs of deleted images. Absent and not accessible
+             images are skipped.
+    :rtype: ImageBatchDeleteResponseSchema
+    """
+    image_ids = await repository_images.images_delete(body.image_ids, current_user, db)
+    await variant_cache_evict(image_ids)
+    return {"deleted": len(image_ids), "image_ids": image_ids}
+
+
+@router.get(
+    "/stats/deletions",
+    response_model=AssetDeletionStatsSchema,
+    dependencies=[Depends(RoleChecker([Role.admin, Role.moder]))],
+)
+async def asset_deletions_stats(db: AsyncSession = Depends(get_db)):
+    """
+    Reports amount of cloudinary assets which are waiting for deletion
+    and which are orphaned after all deletion attempts.
+
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: Amounts of pending and orphaned assets.
+    :rtype: AssetDeletionStatsSchema
+    """
+    return await repository_assets.asset_deletions_stats(db)
+
+
+@router.get(
+    "/stats/savings",
+    response_model=UploadSavingsStatsSchema,
+    dependencies=[Depends(RoleChecker([Role.admin, Role.moder]))],
+)
+async def images_upload_savings(db: AsyncSession = Depends(get_db)):
+    """
+    Reports how many bytes are saved by re-encoding of uploaded images.
+
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: Total sizes of uploaded and stored files.
+    :rtype: UploadSavingsStatsSchema
+    """
+    return await repository_images.images_upload_savings(db)
+
+
 def shortent(about: str) -> str:
     if len(about) > 48:
         about = about[:48] + "…"
@@ -214,42 +435,194 @@ async def image_read(
     )
 
 
-@router.post("/crop/{image_id}")
+@router.post("/crop/{image_id}", response_model=ImageVariantResponseSchema)
 async def image_crop(
-    width: int,
-    height: int,
     image_id: int,
+    width: int = Query(ge=1, le=4096),
+    height: int = Query(ge=1, le=4096),
+    crop: str = Query("fill", pattern=CROP_MODES),
     current_user: User = Depends(auth_service.get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    image = await repository_images.image_exists(image_id, current_user, db)
-    cloud_public_id = image.cloud_public_id
-    cloud_version = image.cloud_version
-    crop_image_url = cloudinary.CloudinaryImage(cloud_public_id).build_url(
-        width=width,
-        height=height,
-        crop="fill",
-        version=cloud_version,
-    )
-    try:
-        image = await repository_images.update_image_url(
-            image_id, crop_image_url, current_user, db
+    """
+    Gets url of cropped variant of image for a current image owner.
+    Original image is kept untouched, and variant url is built only once.
+
+    :param image_id: The ID of image to crop.
+    :type image_id: int
+    :param width: Width of cropped image.
+    :type width: int
+    :param height: Height of cropped image.
+    :type height: int
+    :param crop: Cloudinary crop mode.
+    :type crop: str
+    :param current_user: Current user which must be image owner.
+    :type current_user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: Image variant.
+    :rtype: ImageVariantResponseSchema
+    :raises HTTPException:
+            This exception is raised when image is absent or
+            image owner is different from current user.
+    """
+    url = await image_variant_url(image_id, width, height, crop, current_user, db)
+    if url is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Image {image_id} is absent.",
         )
-    except IntegrityError:
-        raise HTTPException(status_code=400, detail="Image doesnt exists")
-    return image
+    return {
+        "image_id": image_id,
+        "width": width,
+        "height": height,
+        "crop": crop,
+        "url": url,
+    }
+
+
+@router.post(
+    "/qr/batch/",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "content": {
+                "application/zip": {},
+                "image/png": {},
+                "application/pdf": {},
+            }
+        }
+    },
+)
+async def get_qr_codes(
+    body: QrBatchSchema,
+    current_user: User = Depends(auth_service.get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Gets QR codes of many images of a current user at once, as ZIP archive
+    of PNG codes or as one PNG/PDF sheet. Images are authorized by one query,
+    codes are rendered in parallel on the process pool, and ZIP archive is
+    streamed while it is generated. Images of other users are skipped.
+
+    :param body: IDs of images and format of result.
+    :type body: QrBatchSchema
+    :param current_user: Current user which must be images owner.
+    :type current_user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: ZIP archive or sheet of QR codes.
+    :rtype: StreamingResponse
+    :raises HTTPException:
+            This exception is raised when too many images are requested
+            or none of images exists.
+    """
+    if len(body.image_ids) > config.qr_batch_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"No more than {config.qr_batch_size} images are allowed.",
+        )
+    images = await repository_images.images_owned(body.image_ids, current_user, db)
+    if not images:
+        raise HTTPException(status_code=400, detail="Images don't exist")
+    urls = [url for _, url in images]
+
+    if body.format == "zip":
+        names = [f"qr_{image_id}.png" for image_id, _ in images]
+        return StreamingResponse(
+            qr_zip_stream(names, urls),
+            media_type="application/zip",
+            headers={"Content-Disposition": 'attachment; filename="qr_codes.zip"'},
+        )
+    content = await qr_sheet(urls, body.format)
+    return Response(
+        content,
+        media_type="application/pdf" if body.format == "pdf" else "image/png",
+    )
 
 
 @router.post("/qr/{image_id}")
 async def get_qr_code(
     image_id: int,
+    request: Request,
     current_user: User = Depends(auth_service.get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    qr_code_url = await create_qr_code_and_upload(image_id, current_user, db)
-    if qr_code_url:
-        return {"qr_code_url": qr_code_url}
-    raise HTTPException(status_code=400, detail="Failed to generate QR code and upload")
+    """
+    Gets url of QR code of image for a current image owner. The url is
+    signed by token which expires in config.qr_url_expire seconds, so it
+    works without bearer token.
+
+    :param image_id: The ID of image.
+    :type image_id: int
+    :param request: The HTTP request object.
+    :type request: Request
+    :param current_user: Current user which must be image owner.
+    :type current_user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: Signed url of QR code.
+    :rtype: dict
+    :raises HTTPException:
+            This exception is raised when image is absent.
+    """
+    image = await repository_images.image_exists(image_id, current_user, db)
+    if image is None:
+        raise HTTPException(status_code=400, detail="Image doesn't exist")
+    qr_code_url = request.url_for(
+        "get_qr_code_image", image_id=image_id
+    ).include_query_params(token=auth_service.create_qr_token(image_id))
+    return {"qr_code_url": str(qr_code_url)}
+
+
+@router.get(
+    "/qr/{image_id}",
+    response_class=Response,
+    responses={
+        200: {"content": {media_type: {} for media_type in QR_MEDIA_TYPES.values()}}
+    },
+)
+async def get_qr_code_image(
+    image_id: int,
+    request: Request,
+    token: str = Query(),
+    format: str = Query("png", pattern=r"^(png|svg)$"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Gets QR code of image by signed url from get_qr_code. QR code is
+    rendered in memory once per image url and format, and it is cached by
+    clients with ETag validation.
+
+    :param image_id: The ID of image.
+    :type image_id: int
+    :param request: The HTTP request object.
+    :type request: Request
+    :param token: Token which signs the url.
+    :type token: str
+    :param format: "png" or "svg".
+    :type format: str
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: QR code, or 304 response if client has the same QR code.
+    :rtype: Response
+    :raises HTTPException:
+            This exception is raised when token is invalid or image is absent.
+    """
+    if auth_service.decode_qr_token(token) != image_id:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=messages.VALIDATE_CREDENTIALS,
+        )
+    image = await repository_images.image_read(image_id, db)
+    if image is None:
+        raise HTTPException(status_code=400, detail="Image doesn't exist")
+    content, etag = await qr_code(image.image, format)
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content, media_type=QR_MEDIA_TYPES[format], headers=headers)
+
 
 @router.get(
     "/find/{search:path}",
@@ -341,6 +714,7 @@ async def images_search(
                                 db)
     return [
         {
-        'image_id': id, 'small_image_url': small_image, 'short_about': shortent(about)
+        'image_id': id, 'small_image_url': small_image, 'short_about': shortent(about),
+        'comment_count': comment_count, 'star_count': star_count, 'star_sum': star_sum
         }
-        for id, small_image, about in records]
+        for id, small_image, about, comment_count, star_count, star_sum in records]
@@ -3,6 +3,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 import cloudinary
 import cloudinary.uploader
 from starlette.background import BackgroundTasks
+from starlette.concurrency import run_in_threadpool
 
 from src.conf import messages
 from src.database.connect import get_db
@@ -12,6 +13,8 @@ from src.services.auth import auth_service
 from src.conf.config import config
 from src.schemas import UserResponseSchema, RequestEmail, ResetPasswordSchema
 from src.services.email import send_reset_password_email
+from src.services.uploads import prepare_upload
+from src.services.variants import build_variant_url
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -54,12 +57,16 @@ async def update_avatar_user(
     Returns:
         UserResponseSchema: The user's details after the avatar update.
     """
-    r = cloudinary.uploader.upload(
-        file.file, public_id=f"ContactAPP/{current_user.username}", overwrite=True
+    data, _ = await prepare_upload(file)
+    r = await run_in_threadpool(
+        cloudinary.uploader.upload,
+        data,
+        public_id=f"ContactAPP/{current_user.username}",
+        overwrite=True,
     )
 
-    src_url = cloudinary.CloudinaryImage(f"NotesApp/{current_user.username}").build_url(
-        width=250, height=250, crop="fill", version=r.get("version")
+    src_url = build_variant_url(
+        r.get("public_id"), r.get("version"), 250, 250, "fill"
     )
     user = await repository_users.update_avatar(current_user.email, src_url, db)
     return user
@@ -2,6 +2,7 @@ import re
 from typing import List
 
 from pydantic import BaseModel, Field, EmailStr, ConfigDict, field_validator
+from pydantic import model_validator
 from datetime import datetime
 
 
@@ -44,12 +45,45 @@ class ImageDb(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class ImageBatchItemSchema(BaseModel):
+    filename: str
+    image: ImageDb | None = None
+    error: str | None = None
+
+
+class ImageBatchResponseSchema(BaseModel):
+    images: List[ImageBatchItemSchema]
+
+
+class ImageBatchDeleteSchema(BaseModel):
+    image_ids: List[int] = Field(min_length=1, max_length=1000)
+
+
+class ImageBatchDeleteResponseSchema(BaseModel):
+    deleted: int
+    image_ids: List[int]
+
+
 class CropImageDb(BaseModel):
     image_id: int
     width: int
     height: int
 
 
+class ImageVariantResponseSchema(BaseModel):
+    image_id: int
+    width: int
+    height: int
+    crop: str
+    url: str
+
+
+class QrBatchSchema(BaseModel):
+    image_ids: List[int] = Field(min_length=1)
+    """format is "zip" (archive of PNG codes), "png" or "pdf" (one sheet)"""
+    format: str = Field("zip", pattern=r"^(zip|png|pdf)$")
+
+
 class ImageAboutUpdateSchema(BaseModel):
     image_id: int
     about: str
@@ -68,6 +102,9 @@ class SmallImageReadResponseSchema(BaseModel):
     image_id: int
     small_image_url: str
     short_about: str
+    comment_count: int
+    star_count: int
+    star_sum: int
     model_config = ConfigDict(from_attributes=True)
 
 
@@ -78,6 +115,26 @@ class ImageReadResponseSchema(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class AssetDeletionStatsSchema(BaseModel):
+    pending: int
+    orphaned: int
+
+
+class EmometerQueueStatsSchema(BaseModel):
+    due: int
+    scheduled: int
+    running: int
+    dead: int
+    lag_seconds: float
+
+
+class UploadSavingsStatsSchema(BaseModel):
+    images: int
+    original_bytes: int
+    stored_bytes: int
+    saved_bytes: int
+
+
 class CommentDb(BaseModel):
     id: int
     comment: str
@@ -100,11 +157,18 @@ class CommentCreateSchema(BaseModel):
 
 
 class CommentShowSchema(BaseModel):
+    id: int
     comment: str
+    created_at: datetime
+    user_id: int
+    username: str
+    avatar: str | None
+    model_config = ConfigDict(from_attributes=True)
 
 
 class CommentShowAllSchema(BaseModel):
     comments: List[CommentShowSchema]
+    next_cursor: str | None = None
 
 
 class CommentUpdateSchema(BaseModel):
@@ -118,6 +182,46 @@ class CommentDeleteSchema(BaseModel):
     image_id: int
 
 
+class CommentBulkDeleteSchema(BaseModel):
+    comment_ids: List[int] | None = Field(None, min_length=1, max_length=1000)
+    user_id: int | None = None
+    image_id: int | None = None
+    created_from: datetime | None = None
+    created_to: datetime | None = None
+
+    @model_validator(mode="after")
+    def check_filter(self):
+        # time window alone would select comments of all users and images
+        if self.comment_ids is None and self.user_id is None and self.image_id is None:
+            raise ValueError("comment_ids, user_id or image_id must be set.")
+        return self
+
+
+class CommentBulkDeleteResponseSchema(BaseModel):
+    deleted: int
+    comment_ids: List[int]
+
+
+class EmotionRatesSchema(BaseModel):
+    joy: int = Field(ge=0, le=100)
+    anger: int = Field(ge=0, le=100)
+    sadness: int = Field(ge=0, le=100)
+    surprise: int = Field(ge=0, le=100)
+    disgust: int = Field(ge=0, le=100)
+    fear: int = Field(ge=0, le=100)
+
+
+class ImageEmotionsSchema(BaseModel):
+    image_id: int
+    count: int
+    joy: float
+    anger: float
+    sadness: float
+    surprise: float
+    disgust: float
+    fear: float
+
+
 class TagResponseSchema(BaseModel):
     name: str
 
@@ -126,16 +230,43 @@ class ReadTagResponseSchema(BaseModel):
     tags: list
 
 
+def adjust_tag_name(name: str) -> str:
+    # delete first/last/duplicate spaces
+    name = ' '.join(name.split())
+    pattern = r"(^\d|^.*[/&!@`^%$#+])"
+    if re.search(pattern, name):
+        raise ValueError(f"Tag '{name}' cannot start with digit " \
+                         "and cannot contain any special symbols.")
+    return name
+
+
 class TagSchema(BaseModel):
     name: str = Field(min_length=3, max_length=24)
 
     @field_validator("name")
     @classmethod
     def adjust_name(cls, name: str):
-        # delete first/last/duplicate spaces
-        name = ' '.join(name.split())
-        pattern = r"(^\d|^.*[/&!@`^%$#+])"
-        if re.search(pattern, name):
-            raise ValueError(f"Tag '{name}' cannot start with digit " \
-                             "and cannot contain any special symbols.")
-        return name
+        return adjust_tag_name(name)
+
+
+class ImageTagsSchema(BaseModel):
+    tags: List[str] = Field(max_length=5)
+    create_missing: bool = False
+
+    @field_validator("tags")
+    @classmethod
+    def adjust_names(cls, tags: List[str]):
+        names = {}
+        for name in map(adjust_tag_name, tags):
+            if not 3 <= len(name) <= 24:
+                raise ValueError(f"Tag '{name}' must have 3-24 characters.")
+            # tag names are case insensitive
+            names.setdefault(name.lower(), name)
+        return list(names.values())
+
+
+class ImageTagsResponseSchema(BaseModel):
+    image_id: int
+    tags: List[str]
+    added: List[str]
+    removed: List[str]
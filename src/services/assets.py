@@ -0,0 +1,71 @@
+import logging
+
+import cloudinary
+import cloudinary.api
+from starlette.concurrency import run_in_threadpool
+
+from src.conf.config import config
+from src.database.connect import sessionmanager
+from src.repository import assets as repository_assets
+
+
+async def sweep_asset_deletions() -> int:
+    """
+    Destroys one batch of due cloudinary assets from the deletion outbox.
+
+    All claimed assets are destroyed by one Admin API call. Failed assets
+    are retried later with exponential backoff and reported as orphaned
+    when all attempts are exhausted.
+
+    Returns:
+        int: Amount of claimed assets.
+    """
+    async with sessionmanager.session() as db:
+        deletions = await repository_assets.asset_deletions_claim(
+            config.asset_deletion_batch_size, db
+        )
+        if not deletions:
+            return 0
+
+        try:
+            result = await run_in_threadpool(
+                cloudinary.api.delete_resources,
+                [deletion.cloud_public_id for deletion in deletions],
+            )
+            statuses = result.get("deleted", {})
+        except Exception as err:
+            statuses = {}
+            error = str(err)
+        else:
+            error = "Asset is not deleted."
+
+        done, failed = [], []
+        for deletion in deletions:
+            if statuses.get(deletion.cloud_public_id) in ("deleted", "not_found"):
+                done.append(deletion)
+            else:
+                failed.append(deletion)
+
+        orphans = []
+        if failed:
+            orphans = await repository_assets.asset_deletions_retry(failed, error, db)
+        await repository_assets.asset_deletions_done(done, db)
+
+        if orphans:
+            stats = await repository_assets.asset_deletions_stats(db)
+            logging.warning(
+                f"{len(orphans)} cloudinary assets are orphaned ({error}), "
+                f"total: {stats['orphaned']} orphaned, {stats['pending']} pending"
+            )
+        return len(deletions)
+
+
+async def run_asset_deletions() -> None:
+    """
+    Sweeps the deletion outbox while batches are full. It is run periodically
+    by the scheduler, so all due deletions are coalesced into batches.
+    """
+    while True:
+        claimed = await sweep_asset_deletions() or 0
+        if claimed < config.asset_deletion_batch_size:
+            break
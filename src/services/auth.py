@@ -108,6 +108,47 @@ class Auth:
         token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return token
 
+    def create_qr_token(self, image_id: int):
+        """
+        Create a token which signs url of QR code of image, so the url works
+        without bearer token, like in <img> tags.
+
+        Args:
+            image_id (int): The ID of image.
+
+        Returns:
+            str: Encoded QR code token.
+        """
+        expire = datetime.utcnow() + timedelta(seconds=config.qr_url_expire)
+        to_encode = {
+            "sub": str(image_id),
+            "iat": datetime.utcnow(),
+            "exp": expire,
+            "scope": "qr_code",
+        }
+        return jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+
+    def decode_qr_token(self, token: str):
+        """
+        Decode and retrieve the image ID from a QR code token.
+
+        Args:
+            token (str): QR code token.
+
+        Returns:
+            int: The ID of image.
+        """
+        try:
+            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            if payload["scope"] == "qr_code":
+                return int(payload["sub"])
+        except (JWTError, KeyError, ValueError):
+            pass
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=messages.VALIDATE_CREDENTIALS,
+        )
+
     async def get_email_from_token(self, token: str):
         """
         Decode and retrieve the email from an email confirmation token.
@@ -0,0 +1,67 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Hashable
+
+
+class LRUCache:
+    """Small in-process cache which drops the least recently used items."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get cached value and mark it as recently used.
+
+        Args:
+            key (Hashable): Key of cached value.
+            default (Any, optional): Value returned when key is absent.
+
+        Returns:
+            Any: Cached value or default.
+        """
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Cache value, the least recently used value is dropped when cache is full.
+
+        Args:
+            key (Hashable): Key of cached value.
+            value (Any): Value to cache.
+        """
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove value from cache."""
+        with self._lock:
+            return self._items.pop(key, default)
+
+    def pop_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """
+        Remove all values whose keys match predicate.
+
+        Args:
+            predicate (Callable[[Hashable], bool]): Check of cached key.
+
+        Returns:
+            int: Amount of removed values.
+        """
+        with self._lock:
+            keys = [key for key in self._items if predicate(key)]
+            for key in keys:
+                del self._items[key]
+            return len(keys)
+
+    def __len__(self) -> int:
+        return len(self._items)
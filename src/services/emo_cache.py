@@ -0,0 +1,105 @@
+import hashlib
+import logging
+import re
+import unicodedata
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from src.conf.config import config
+from src.services.cache import LRUCache
+
+repeated_chars = re.compile(r"(.)\1{2,}")
+
+
+def normalize_comment(comment: str) -> str:
+    """
+    Normalize comment text, so near-identical comments ("Nice!!!", "nice !!",
+    "niiiice!") get the same cache key.
+
+    Args:
+        comment (str): Comment text.
+
+    Returns:
+        str: Normalized text.
+    """
+    text = unicodedata.normalize("NFKC", comment).casefold()
+    text = repeated_chars.sub(r"\1\1", text)
+    text = re.sub(r"\s*([^\w\s])", r"\1", text)
+    return " ".join(text.split())
+
+
+def comment_key(comment: str) -> str:
+    digest = hashlib.sha256(normalize_comment(comment).encode()).hexdigest()
+    return f"emo:{digest}"
+
+
+class EmoScoreCache:
+    """
+    Cache of emotion rates by hash of normalized comment text. Rates are kept
+    in Redis, shared by all workers, and in a local LRU cache which also
+    serves as a fallback when Redis is unavailable.
+    """
+
+    def __init__(self):
+        self._lru = LRUCache(config.emo_cache_size)
+        self._redis: redis.Redis | None = None
+
+    @property
+    def redis(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = redis.Redis(
+                host=config.redis_host,
+                port=config.redis_port,
+                password=config.redis_password,
+                db=0,
+                socket_connect_timeout=1,
+                socket_timeout=1,
+            )
+        return self._redis
+
+    async def get(self, comment: str) -> tuple | None:
+        """
+        Get rates of comment text.
+
+        Args:
+            comment (str): Comment text.
+
+        Returns:
+            tuple | None: Rates (joy, anger, sadness, surprise, disgust, fear),
+            or None on cache miss.
+        """
+        key = comment_key(comment)
+        rates = self._lru.get(key)
+        if rates is not None:
+            return rates
+        try:
+            value = await self.redis.get(key)
+        except RedisError as err:
+            logging.warning(f"Emotion cache is unavailable: {err}")
+            return None
+        if value is None:
+            return None
+        rates = tuple(int(rate) for rate in value.split(b","))
+        self._lru.set(key, rates)
+        return rates
+
+    async def set(self, comment: str, rates: tuple) -> None:
+        """
+        Cache rates of comment text.
+
+        Args:
+            comment (str): Comment text.
+            rates (tuple): Rates (joy, anger, sadness, surprise, disgust, fear).
+        """
+        key = comment_key(comment)
+        self._lru.set(key, tuple(rates))
+        try:
+            await self.redis.set(
+                key, ",".join(str(rate) for rate in rates), ex=config.emo_cache_ttl
+            )
+        except RedisError as err:
+            logging.warning(f"Emotion cache is unavailable: {err}")
+
+
+emo_cache = EmoScoreCache()
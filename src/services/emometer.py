@@ -0,0 +1,374 @@
+import asyncio
+import json
+import logging
+import re
+from abc import ABC, abstractmethod
+from typing import Dict, List
+
+from pydantic import ValidationError
+
+from src.conf.config import config
+from src.database.connect import sessionmanager
+from src.repository import emometer as repository_emometer
+from src.repository.emometer import EMO_FIELDS
+from src.schemas import EmotionRatesSchema
+from src.services.emo_cache import emo_cache
+from src.services.emotions import EMOTIONS
+from src.services.events import comment_events
+from src.services.lexicon import Lexicon
+from src.services.llm import llm_client
+
+TEMPLATE = "Imagine that you show emotions of joy, anger, sadness, " \
+    "surprise, disgust, and fear of people in messages which are " \
+    "quoted with \"&&&\" sequence. Rate the following messages in " \
+    "percentage of each emotion. Each rate must start with \"<(@\" "\
+    "sequence and end with \"@)>\". Here is the list of my messages:"
+
+TEMPLATE_JSON = "Imagine that you show emotions of joy, anger, sadness, " \
+    "surprise, disgust, and fear of people in messages which are " \
+    "quoted with \"&&&\" sequence. Rate the following messages in " \
+    "percentage of each emotion. Answer with JSON object only, which maps " \
+    "number of each message to object with integer percentages of " \
+    "\"joy\", \"anger\", \"sadness\", \"surprise\", \"disgust\" and " \
+    "\"fear\". Here is the list of my messages:"
+
+# One token of answer: number of message at the line start, or rate of emotion
+answer_token = re.compile(
+    r"^\W*(?P<number>\d+)\s*[.)]"
+    rf"|\b(?P<emotion>{'|'.join(EMOTIONS)})[^\d\n]{{0,24}}?(?P<rate>\d{{1,3}})\s*%",
+    re.I | re.M,
+)
+
+# Expected size of rates of one message in the answer
+ANSWER_TOKENS = 60
+
+
+def build_prompt(comments: List[str], json_mode: bool = False) -> str:
+    """
+    Build one prompt which asks to rate numbered comments.
+
+    Args:
+        comments (List[str]): Comments to rate.
+        json_mode (bool): Ask for answer in JSON.
+
+    Returns:
+        str: Prompt for ChatGPT.
+    """
+    request = ""
+    for i, com in enumerate(comments, start=1):
+        request += "\n" + f"{i}. &&&{com}&&&."
+    return (TEMPLATE_JSON if json_mode else TEMPLATE) + request
+
+
+def parse_answer(answ: str, count: int) -> tuple[Dict[int, tuple], Dict[int, str]]:
+    """
+    Read emotion rates of all messages by one scan of answer. Rates follow
+    the number of their message, rates of the only message may go without
+    number.
+
+    Args:
+        answ (str): Answer of ChatGPT.
+        count (int): Amount of rated messages.
+
+    Returns:
+        tuple[Dict[int, tuple], Dict[int, str]]: Rates (joy, anger, sadness,
+        surprise, disgust, fear) by message number (starting with 1), and
+        errors of malformed messages. Messages absent in answer are absent
+        in both.
+    """
+    rates: Dict[int, dict] = {}
+    number = 1 if count == 1 else None
+    for token in answer_token.finditer(answ):
+        if token.group("number"):
+            number = int(token.group("number"))
+            if not 1 <= number <= count:
+                number = None
+        elif number is not None:
+            emotion = token.group("emotion").lower()
+            rates.setdefault(number, {}).setdefault(emotion, int(token.group("rate")))
+
+    scores, errors = {}, {}
+    for number, rate in rates.items():
+        missing = [emotion for emotion in EMOTIONS if emotion not in rate]
+        wrong = [emotion for emotion, value in rate.items() if value > 100]
+        if missing:
+            errors[number] = f"no rates of {', '.join(missing)}"
+        elif wrong:
+            errors[number] = f"rates of {', '.join(wrong)} are above 100%"
+        else:
+            scores[number] = tuple(rate[emotion] for emotion in EMOTIONS)
+    return scores, errors
+
+
+def parse_json_answer(
+    answ: str, count: int
+) -> tuple[Dict[int, tuple], Dict[int, str]]:
+    """
+    Read emotion rates of all messages from JSON answer and validate them.
+
+    Args:
+        answ (str): Answer of ChatGPT.
+        count (int): Amount of rated messages.
+
+    Returns:
+        tuple[Dict[int, tuple], Dict[int, str]]: Rates (joy, anger, sadness,
+        surprise, disgust, fear) by message number (starting with 1), and
+        errors of malformed messages. Messages absent in answer are absent
+        in both.
+
+    Raises:
+        ValueError: If answer is not JSON object.
+    """
+    data = json.loads(answ[answ.find("{"):answ.rfind("}") + 1])
+    if not isinstance(data, dict):
+        raise ValueError("Answer is not JSON object")
+    scores, errors = {}, {}
+    for key, item in data.items():
+        number = int(key) if str(key).isdigit() else 0
+        if not 1 <= number <= count:
+            continue
+        try:
+            rates = EmotionRatesSchema.model_validate(item)
+        except ValidationError as err:
+            errors[number] = "; ".join(
+                f"{'.'.join(map(str, e['loc'])) or 'rates'}: {e['msg']}"
+                for e in err.errors()
+            )
+            continue
+        scores[number] = tuple(getattr(rates, emotion) for emotion in EMOTIONS)
+    return scores, errors
+
+
+class EmotionScorer(ABC):
+    """Base class of emotion scorers which rate batches of comments."""
+
+    @abstractmethod
+    async def score(self, comments: List[str]) -> List[tuple | None]:
+        """
+        Rate emotions of comments.
+
+        Args:
+            comments (List[str]): Comments to rate.
+
+        Returns:
+            List[tuple | None]: Rates (joy, anger, sadness, surprise, disgust,
+            fear) of each comment, None for comments which are not rated.
+        """
+
+
+class LLMScorer(EmotionScorer):
+    """Rates all comments of batch by one ChatGPT request."""
+
+    async def score(self, comments: List[str]) -> List[tuple | None]:
+        json_mode = config.emometer_json
+        request = build_prompt(comments, json_mode)
+        answ = await llm_client.complete(
+            request, ANSWER_TOKENS * len(comments), json_mode
+        )
+        scores = None
+        if json_mode:
+            try:
+                scores, errors = parse_json_answer(answ, len(comments))
+            except ValueError:
+                logging.warning("Emometer answer is not JSON, it is parsed as text")
+        if scores is None:
+            scores, errors = parse_answer(answ, len(comments))
+        numbers = range(1, len(comments) + 1)
+        for number in numbers:
+            if number not in scores:
+                errors.setdefault(number, "absent in answer")
+        if errors:
+            logging.warning(f"Emometer answer is malformed: {errors}")
+        return [scores.get(number) for number in numbers]
+
+
+class LexiconScorer(EmotionScorer):
+    """Rates comments locally by the built-in lexicon, without network."""
+
+    def __init__(self):
+        self.lexicon = Lexicon()
+
+    def analyze(self, comments: List[str]) -> tuple:
+        return self.lexicon.analyze(comments)
+
+    async def score(self, comments: List[str]) -> List[tuple | None]:
+        rates, _ = self.analyze(comments)
+        return [tuple(int(rate) for rate in row) for row in rates]
+
+
+class HybridScorer(EmotionScorer):
+    """
+    Uses the lexicon as a fallback when ChatGPT is unavailable or has not
+    rated a comment. With prefilter, comments well covered by the lexicon
+    (config.lexicon_min_coverage) are rated locally, and only the rest
+    are sent to ChatGPT.
+    """
+
+    def __init__(self, prefilter: bool):
+        self.prefilter = prefilter
+        self.lexicon = LexiconScorer()
+        self.llm = LLMScorer()
+
+    async def score(self, comments: List[str]) -> List[tuple | None]:
+        rates, coverage = self.lexicon.analyze(comments)
+        local = [tuple(int(rate) for rate in row) for row in rates]
+        if self.prefilter:
+            rest = [
+                i for i in range(len(comments))
+                if coverage[i] < config.lexicon_min_coverage
+            ]
+        else:
+            rest = list(range(len(comments)))
+        result = list(local)
+        if rest:
+            try:
+                remote = await self.llm.score([comments[i] for i in rest])
+            except Exception as err:
+                logging.warning(f"ChatGPT is unavailable, lexicon is used: {err!r}")
+                remote = [None] * len(rest)
+            for i, rate in zip(rest, remote):
+                result[i] = rate or local[i]
+        return result
+
+
+def get_scorer(backend: str) -> EmotionScorer:
+    """
+    Create emotion scorer by name: "llm" (ChatGPT), "lexicon" (local only),
+    "fallback" (ChatGPT with lexicon fallback) or "hybrid" (lexicon
+    pre-filter and fallback).
+
+    Raises:
+        ValueError: If backend is unknown.
+    """
+    if backend == "llm":
+        return LLMScorer()
+    if backend == "lexicon":
+        return LexiconScorer()
+    if backend in ("hybrid", "fallback"):
+        return HybridScorer(prefilter=backend == "hybrid")
+    raise ValueError(
+        f'Unknown emometer backend "{backend}", '
+        'it must be "llm", "lexicon", "fallback" or "hybrid"'
+    )
+
+
+scorer = get_scorer(config.emometer_backend)
+
+
+async def emometer(comments: Dict[int, str]) -> Dict[int, tuple]:
+    """
+    Rate emotions of many comments by the configured scorer and cache rates
+    by comment text.
+
+    Args:
+        comments (Dict[int, str]): Comment text by comment ID.
+
+    Returns:
+        Dict[int, tuple]: Rates (joy, anger, sadness, surprise, disgust, fear)
+        by comment ID. Comments which are not rated are absent.
+    """
+    ids = list(comments)
+    rates = await scorer.score([comments[id] for id in ids])
+    scores = {id: rate for id, rate in zip(ids, rates) if rate is not None}
+    for comment_id, rates in scores.items():
+        await emo_cache.set(comments[comment_id], rates)
+    return scores
+
+
+async def sweep_emometer_jobs() -> int:
+    """
+    Rates one batch of due comments from the emometer queue.
+
+    Jobs are leased and comment texts are read by one short transaction,
+    so no lock is held while the scorer works. Rates are stored and jobs are
+    removed by another transaction, and comments which are not rated are
+    retried later with exponential backoff. Rates of comments which are
+    edited meanwhile are dropped.
+
+    Returns:
+        int: Amount of claimed jobs.
+    """
+    jobs = []
+    async with sessionmanager.session() as db:
+        jobs = await repository_emometer.emometer_jobs_claim(
+            config.emometer_batch_size, db
+        )
+    if not jobs:
+        return 0
+
+    comments = {comment_id: comment for comment_id, _, _, comment in jobs}
+    revisions = {comment_id: revision for comment_id, _, revision, _ in jobs}
+    images = {comment_id: image_id for comment_id, image_id, _, _ in jobs}
+    try:
+        scores = await emometer(comments)
+    except Exception as err:
+        scores = {}
+        error = repr(err)
+    else:
+        error = "Comment is not rated."
+    failed = [comment_id for comment_id in comments if comment_id not in scores]
+
+    rated, stale, dead = [], 0, 0
+    async with sessionmanager.session() as db:
+        rated, stale, dead = await repository_emometer.emometer_jobs_done(
+            revisions, scores, error, db
+        )
+    await comment_events.publish_many(
+        [
+            (
+                images[comment_id],
+                {
+                    "type": "rated",
+                    "comment_id": comment_id,
+                    **dict(zip(EMO_FIELDS, scores[comment_id])),
+                },
+            )
+            for comment_id in rated
+        ]
+    )
+    if stale:
+        logging.info(f"Emometer has dropped {stale} rates of edited comments")
+    if failed:
+        logging.warning(f"Emometer has not rated comments {failed}: {error}")
+    if dead:
+        logging.error(f"{dead} emometer jobs are dead after all attempts: {error}")
+    return len(jobs)
+
+
+class EmometerWorkers:
+    """
+    Pool of config.emometer_workers tasks which rate comments from the durable
+    emometer queue. Each worker claims batches of up to
+    config.emometer_batch_size due jobs while batches are full, and polls
+    the queue every config.emometer_batch_window_ms milliseconds otherwise.
+    Jobs of stopped or crashed workers are claimed again after their lease.
+    """
+
+    def __init__(self):
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        """Start workers. It must be called from the running event loop."""
+        self._tasks = [
+            asyncio.create_task(self._run()) for _ in range(config.emometer_workers)
+        ]
+
+    async def stop(self) -> None:
+        """Stop workers. Their unfinished jobs stay in the queue."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                claimed = await sweep_emometer_jobs()
+            except Exception as err:
+                logging.error(f"Emometer worker failed: {err!r}")
+                claimed = 0
+            if claimed < config.emometer_batch_size:
+                await asyncio.sleep(config.emometer_batch_window_ms / 1000)
+
+
+emometer_workers = EmometerWorkers()
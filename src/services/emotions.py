@@ -0,0 +1,2 @@
+# Emotions rated by emometer, rates of a comment are tuples in this order
+EMOTIONS = ("joy", "anger", "sadness", "surprise", "disgust", "fear")
@@ -0,0 +1,220 @@
+import asyncio
+import contextlib
+import json
+import logging
+from typing import Callable, Dict, Iterator, List, Set
+
+import redis.asyncio as redis
+from fastapi.encoders import jsonable_encoder
+from redis.exceptions import RedisError
+
+from src.conf.config import config
+
+CHANNEL_PREFIX = "comments:"
+
+# The last event of subscriber which has not kept up with events. Its pending
+# events are dropped, so the client must reload the thread.
+OVERFLOW = {"type": "overflow"}
+
+
+class Subscription:
+    """
+    Bounded queue of events of one connection. When it is full, pending
+    events are replaced by OVERFLOW and the next events are ignored, so a slow
+    client never makes memory grow and never delays other clients.
+    """
+
+    def __init__(self, size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(size)
+        self.overflowed = False
+
+    def put(self, event: dict) -> None:
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+
+    async def get(self, timeout: float) -> dict | None:
+        """
+        Wait for the next event.
+
+        Args:
+            timeout (float): Time to wait in seconds.
+
+        Returns:
+            dict | None: Event, or None if there is no event during timeout.
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class CommentEventHub:
+    """
+    Real-time events of comments of images. Events are published to Redis
+    channel "comments:<image_id>", and each application worker listens to all
+    these channels by one pattern subscription and dispatches events to its
+    own subscribers. When Redis is unavailable, events are dispatched to
+    subscribers of the current worker only.
+
+    The same listener delivers broadcasts of other channels to handlers
+    registered by handle(), like evictions of caches of all workers.
+    """
+
+    def __init__(self):
+        self._subscriptions: Dict[int, Set[Subscription]] = {}
+        self._handlers: Dict[str, Callable[[dict], None]] = {}
+        self._redis: redis.Redis | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def redis(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = redis.Redis(
+                host=config.redis_host,
+                port=config.redis_port,
+                password=config.redis_password,
+                db=0,
+                socket_connect_timeout=1,
+                socket_timeout=1,
+            )
+        return self._redis
+
+    def start(self) -> None:
+        """Start listening. It must be called from the running event loop."""
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """Stop listening."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    @contextlib.contextmanager
+    def subscribe(self, image_id: int) -> Iterator[Subscription]:
+        """
+        Subscribe to events of comments of image while the context is active.
+
+        Args:
+            image_id (int): The ID of image.
+
+        Yields:
+            Subscription: Queue of events.
+        """
+        subscription = Subscription(config.events_queue_size)
+        self._subscriptions.setdefault(image_id, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            subscribers = self._subscriptions.get(image_id, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscriptions.pop(image_id, None)
+
+    def handle(self, channel: str, handler: Callable[[dict], None]) -> None:
+        """
+        Register handler of broadcasts of channel. It must be called before
+        start().
+
+        Args:
+            channel (str): Redis channel.
+            handler (Callable[[dict], None]): Handler of broadcast message.
+        """
+        self._handlers[channel] = handler
+
+    async def broadcast(self, channel: str, message: dict) -> None:
+        """
+        Send message to handlers of channel in all other workers. The current
+        worker is expected to handle it itself before the broadcast.
+
+        Args:
+            channel (str): Redis channel registered by handle().
+            message (dict): JSON serializable message.
+        """
+        try:
+            await self.redis.publish(channel, json.dumps(message))
+        except RedisError as err:
+            logging.warning(f"Broadcast to {channel} is not shared by Redis: {err}")
+
+    async def publish(self, image_id: int, event: dict) -> None:
+        """
+        Send event to subscribers of image in all workers.
+
+        Args:
+            image_id (int): The ID of image.
+            event (dict): Event with "type" key.
+        """
+        event = jsonable_encoder(event)
+        try:
+            await self.redis.publish(f"{CHANNEL_PREFIX}{image_id}", json.dumps(event))
+        except RedisError as err:
+            logging.warning(f"Comment events are not shared by Redis: {err}")
+            self._dispatch(image_id, event)
+
+    async def publish_many(self, events: List[tuple]) -> None:
+        """
+        Send many events by one Redis round trip.
+
+        Args:
+            events (List[tuple]): Image ID and event of each event.
+        """
+        if not events:
+            return
+        events = [(image_id, jsonable_encoder(event)) for image_id, event in events]
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for image_id, event in events:
+                    pipe.publish(f"{CHANNEL_PREFIX}{image_id}", json.dumps(event))
+                await pipe.execute()
+        except RedisError as err:
+            logging.warning(f"Comment events are not shared by Redis: {err}")
+            for image_id, event in events:
+                self._dispatch(image_id, event)
+
+    def _dispatch(self, image_id: int, event: dict) -> None:
+        for subscription in self._subscriptions.get(image_id, ()):
+            subscription.put(event)
+
+    async def _listen(self) -> None:
+        # The subscriber connection waits for messages without socket timeout
+        listener = redis.Redis(
+            host=config.redis_host,
+            port=config.redis_port,
+            password=config.redis_password,
+            db=0,
+            socket_connect_timeout=1,
+        )
+        try:
+            while True:
+                pubsub = listener.pubsub(ignore_subscribe_messages=True)
+                try:
+                    await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                    if self._handlers:
+                        await pubsub.subscribe(*self._handlers)
+                    async for message in pubsub.listen():
+                        channel = message["channel"].decode()
+                        if message["type"] == "message":
+                            self._handlers[channel](json.loads(message["data"]))
+                            continue
+                        image_id = int(channel[len(CHANNEL_PREFIX):])
+                        if image_id in self._subscriptions:
+                            self._dispatch(image_id, json.loads(message["data"]))
+                except (RedisError, OSError) as err:
+                    logging.warning(f"Comment events listener is reconnecting: {err}")
+                finally:
+                    # Connection of the broken subscription is closed before retry
+                    await pubsub.close()
+                await asyncio.sleep(1)
+        finally:
+            await listener.close()
+
+
+comment_events = CommentEventHub()
@@ -0,0 +1,115 @@
+"""
+Local fake of ChatGPT chat completions API for offline testing of emometer
+throughput and backpressure. Run it by
+
+    uvicorn src.services.fake_llm:app --port 8001
+
+and start the application with GPT_API_BASE=http://localhost:8001/v1.
+Behaviour is configured by FAKE_LLM_LATENCY_MS, FAKE_LLM_RPM and
+FAKE_LLM_ERROR_RATE environment variables. GET /stats shows counters.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from collections import deque
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+from src.services.emotions import EMOTIONS
+
+
+class FakeSettings(BaseSettings):
+    latency_ms: int = 300
+    rpm: int = 600
+    error_rate: float = 0.0
+
+    model_config = SettingsConfigDict(env_prefix="FAKE_LLM_")
+
+
+settings = FakeSettings()
+app = FastAPI(title="Fake ChatGPT")
+
+message = re.compile(r"^(\d+)\. &&&(.*?)&&&\.$", re.M | re.S)
+requests: deque = deque()
+stats = {"requests": 0, "rejected": 0, "failed": 0, "in_flight": 0, "max_in_flight": 0}
+
+
+def fake_rates(text: str) -> list[int]:
+    """Deterministic emotion rates of text."""
+    digest = hashlib.sha256(text.encode()).digest()
+    return [digest[i] * 100 // 255 for i in range(len(EMOTIONS))]
+
+
+def error(status_code: int, message: str, error_type: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"error": {"message": message, "type": error_type}},
+    )
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt = body["messages"][-1]["content"]
+
+    now = time.monotonic()
+    while requests and now - requests[0] > 60:
+        requests.popleft()
+    if len(requests) >= settings.rpm:
+        stats["rejected"] += 1
+        return error(429, "Rate limit reached for requests", "requests")
+    requests.append(now)
+    stats["requests"] += 1
+
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+    try:
+        await asyncio.sleep(settings.latency_ms / 1000)
+    finally:
+        stats["in_flight"] -= 1
+    if random.random() < settings.error_rate:
+        stats["failed"] += 1
+        return error(503, "The server is overloaded", "server_error")
+
+    messages = message.findall(prompt)
+    if body.get("response_format", {}).get("type") == "json_object":
+        answer = json.dumps(
+            {number: dict(zip(EMOTIONS, fake_rates(text))) for number, text in messages}
+        )
+    else:
+        answer = "\n".join(
+            f"{number}. "
+            + " ".join(
+                f"<(@{emotion}: {rate}%@)>"
+                for emotion, rate in zip(EMOTIONS, fake_rates(text))
+            )
+            for number, text in messages
+        )
+    return {
+        "id": f"chatcmpl-{stats['requests']}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": len(prompt) // 4,
+            "completion_tokens": len(answer) // 4,
+            "total_tokens": (len(prompt) + len(answer)) // 4,
+        },
+    }
+
+
+@app.get("/stats")
+async def read_stats():
+    return {**stats, "last_minute": len(requests)}
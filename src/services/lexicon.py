@@ -0,0 +1,86 @@
+import re
+from typing import List
+
+import numpy as np
+
+from src.services.emotions import EMOTIONS
+
+# Compact built-in lexicon: words and emoji which express each emotion
+LEXICON = {
+    "joy": "happy happiness glad joy joyful love loved lovely like nice cool "
+           "awesome amazing great good best beautiful wonderful fantastic "
+           "excellent perfect cute fun funny lol haha hahaha enjoy delight "
+           "smile yay thanks thank super brilliant gorgeous sweet charming "
+           "😀 😃 😄 😁 😆 😊 😍 🥰 😘 😂 🤣 ❤ 👍 👏 🎉 🔥 💯 ✨",
+    "anger": "angry anger mad furious hate hated rage annoying annoyed "
+             "irritating stupid idiot idiotic damn shut outrageous ridiculous "
+             "terrible awful worst trash 😠 😡 🤬 👎 💢",
+    "sadness": "sad sadness unhappy cry crying cried tears sorry miss missed "
+               "lonely alone depressed depressing grief broken heartbroken "
+               "tragic lost pity unfortunately 😢 😭 😞 😔 💔 🥺",
+    "surprise": "wow whoa omg unbelievable incredible unexpected surprised "
+                "surprise surprising shocked shocking really astonishing "
+                "amazing 😮 😯 😲 🤯 😳 ‼ ⁉",
+    "disgust": "disgusting disgust gross yuck ew eww nasty ugly horrible vile "
+               "sick creepy cringe revolting 🤢 🤮 💩",
+    "fear": "fear afraid scared scary terrified terrifying frightening horror "
+            "panic nervous anxious worried worry creepy danger dangerous "
+            "😨 😱 😰 😟",
+}
+# Weight of one matched token for each of its emotions
+WEIGHT = 0.9
+
+# Words and single non-ASCII symbols (emoji), ASCII punctuation is skipped
+token_pattern = re.compile(r"\w+|[^\w\s\x00-\x7f]")
+
+
+class Lexicon:
+    """
+    Vocabulary matrix of emotion weights. Row 0 belongs to unknown tokens,
+    so the whole batch is scored by array lookups without Python loops over
+    emotions.
+    """
+
+    def __init__(self, lexicon: dict = LEXICON):
+        self.vocabulary = {}
+        for emotion, words in lexicon.items():
+            for word in words.split():
+                self.vocabulary.setdefault(word, len(self.vocabulary) + 1)
+        self.matrix = np.zeros(
+            (len(self.vocabulary) + 1, len(EMOTIONS)), np.float32
+        )
+        for column, emotion in enumerate(EMOTIONS):
+            rows = [self.vocabulary[word] for word in lexicon[emotion].split()]
+            self.matrix[rows, column] = WEIGHT
+
+    def analyze(self, comments: List[str]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Score batch of comments.
+
+        Args:
+            comments (List[str]): Comments to score.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Rates (n x 6 array of integers
+            0-100 in order of EMOTIONS) and coverage (share of tokens found
+            in the vocabulary) of each comment.
+        """
+        tokens = [
+            token_pattern.findall(comment.casefold().replace("\ufe0f", ""))
+            for comment in comments
+        ]
+        lengths = np.fromiter((len(t) for t in tokens), np.int64, len(tokens))
+        indexes = np.fromiter(
+            (self.vocabulary.get(token, 0) for t in tokens for token in t),
+            np.int64,
+            int(lengths.sum()),
+        )
+        segments = np.repeat(np.arange(len(tokens)), lengths)
+
+        sums = np.zeros((len(tokens), len(EMOTIONS)), np.float32)
+        np.add.at(sums, segments, self.matrix[indexes])
+        hits = np.bincount(segments, weights=indexes > 0, minlength=len(tokens))
+
+        rates = np.rint(100 * sums / np.maximum(hits, 1)[:, None]).astype(np.int64)
+        coverage = hits / np.maximum(lengths, 1)
+        return np.clip(rates, 0, 100), coverage
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import random
+
+import openai
+
+from src.conf.config import config
+
+openai.api_key = config.gpt_api_key
+if config.gpt_api_base:
+    openai.api_base = config.gpt_api_base
+
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    openai.error.APIConnectionError,
+    openai.error.APIError,
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough amount of tokens in text (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """
+    Rate limiter which allows up to `rate` units per minute with bursts
+    up to the same amount. Waiters are served in FIFO order.
+    """
+
+    def __init__(self, rate: int):
+        self.rate = rate
+        self._tokens = float(rate)
+        self._updated: float | None = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: int = 1) -> None:
+        """
+        Wait until `amount` units are available and take them.
+
+        Args:
+            amount (int): Units to take. It is limited by bucket capacity.
+        """
+        amount = min(amount, self.rate)
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self._updated is not None:
+                    elapsed = now - self._updated
+                    refill = elapsed * self.rate / 60
+                    self._tokens = min(self.rate, self._tokens + refill)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                await asyncio.sleep((amount - self._tokens) * 60 / self.rate)
+
+
+class LLMClient:
+    """
+    Async ChatGPT client. Requests are limited by a concurrency semaphore and
+    by token buckets matching provider RPM/TPM quotas. Each request has
+    a timeout, and failed requests are retried with exponential backoff
+    and full jitter.
+    """
+
+    def __init__(self):
+        self._semaphore = asyncio.Semaphore(config.llm_concurrency)
+        self._requests = TokenBucket(config.llm_rpm)
+        self._tokens = TokenBucket(config.llm_tpm)
+
+    async def complete(
+        self, prompt: str, completion_tokens: int = 0, json_mode: bool = False
+    ) -> str:
+        """
+        Send one prompt and get the answer.
+
+        Args:
+            prompt (str): Prompt for ChatGPT.
+            completion_tokens (int): Expected size of answer in tokens,
+                it is counted by TPM limiter together with the prompt.
+            json_mode (bool): Ask ChatGPT to answer with JSON object.
+
+        Returns:
+            str: Answer of ChatGPT.
+
+        Raises:
+            openai.error.OpenAIError, asyncio.TimeoutError: If all attempts
+            fail or the error is not retryable.
+        """
+        tokens = estimate_tokens(prompt) + completion_tokens
+        options = {"response_format": {"type": "json_object"}} if json_mode else {}
+        for attempt in range(config.llm_retries + 1):
+            async with self._semaphore:
+                await self._requests.acquire()
+                await self._tokens.acquire(tokens)
+                try:
+                    chat_completion = await asyncio.wait_for(
+                        openai.ChatCompletion.acreate(
+                            model=config.gpt_model,
+                            messages=[{"role": "user", "content": prompt}],
+                            request_timeout=config.llm_timeout,
+                            **options,
+                        ),
+                        config.llm_timeout,
+                    )
+                    return chat_completion.choices[0].message.content
+                except RETRYABLE_ERRORS as err:
+                    if attempt == config.llm_retries:
+                        raise
+                    logging.warning(f"ChatGPT request failed ({err!r}), retrying")
+            delay = min(config.llm_backoff_max, config.llm_backoff * 2 ** attempt)
+            await asyncio.sleep(random.uniform(0, delay))
+
+
+llm_client = LLMClient()
@@ -0,0 +1,57 @@
+"""
+Maintenance commands which recompute derived data from the source tables.
+Run them by
+
+    python -m src.services.maintenance <command>
+
+Commands:
+    emotion_stats   recompute image_emotion_stats from rated comments
+    counters        repair comment and star counters of images
+"""
+import asyncio
+import logging
+import sys
+
+from src.database.connect import sessionmanager
+from src.repository import emometer as repository_emometer
+from src.repository import images as repository_images
+
+
+async def backfill_image_emotion_stats() -> int:
+    """
+    Recomputes emotion stats of all images by one aggregate query.
+
+    Returns:
+        int: Amount of images with rated comments.
+    """
+    async with sessionmanager.session() as db:
+        return await repository_emometer.image_emotion_stats_backfill(db)
+
+
+async def repair_image_counters() -> int:
+    """
+    Fixes comment and star counters of images which differ from actual
+    amounts. It is also run periodically by the scheduler.
+
+    Returns:
+        int: Amount of fixed images.
+    """
+    repaired = 0
+    async with sessionmanager.session() as db:
+        repaired = await repository_images.images_counters_repair(db)
+    if repaired:
+        logging.warning(f"Counters of {repaired} images are repaired")
+    return repaired
+
+
+COMMANDS = {
+    "emotion_stats": backfill_image_emotion_stats,
+    "counters": repair_image_counters,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in COMMANDS:
+        print(__doc__)
+        sys.exit(1)
+    print(f"{sys.argv[1]}: {asyncio.run(COMMANDS[sys.argv[1]]())}")
@@ -0,0 +1,45 @@
+import base64
+import binascii
+from datetime import datetime
+
+from fastapi import HTTPException, status
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    """
+    Encodes position in list ordered by (created_at, id) into opaque cursor.
+
+    Args:
+        created_at (datetime): Creation time of the last item of page.
+        id (int): The ID of the last item of page.
+
+    Returns:
+        str: Url-safe cursor of the next page.
+    """
+    position = f"{created_at.isoformat()}|{id}"
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    Decodes cursor made by encode_cursor.
+
+    Args:
+        cursor (str): Cursor of page.
+
+    Returns:
+        tuple[datetime, int]: Creation time and ID of the last item of
+        the previous page.
+
+    Raises:
+        HTTPException: If cursor is malformed.
+    """
+    try:
+        position = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, id = position.decode().split("|")
+        return datetime.fromisoformat(created_at), int(id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Cursor is malformed.",
+        )
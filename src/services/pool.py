@@ -0,0 +1,46 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+from src.conf.config import config
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    Get the process pool for CPU bound work (image encoding, rendering, etc.).
+    The pool is created on the first call.
+
+    Returns:
+        ProcessPoolExecutor: Shared process pool.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=config.worker_processes)
+    return _pool
+
+
+def shutdown_process_pool() -> None:
+    """Shut down the process pool if it was created."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+async def run_in_process(func: Callable, *args, **kwargs) -> Any:
+    """
+    Run picklable function in the process pool without blocking the event loop.
+
+    Args:
+        func (Callable): Module level function to run.
+
+    Returns:
+        Any: Result of the function.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_process_pool(), partial(func, *args, **kwargs)
+    )
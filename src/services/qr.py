@@ -1,54 +1,202 @@
-import os
-from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import math
+import zipfile
+from io import BytesIO
+from typing import AsyncIterator, List
 
-import cloudinary
 import qrcode
-from fastapi import HTTPException
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+import qrcode.image.svg
+from PIL import Image as PILImage
+from starlette.concurrency import run_in_threadpool
 
-from src.repository.images import image_exists
+from src.conf.config import config
+from src.services.cache import LRUCache
+from src.services.pool import run_in_process
 
-scheduler = AsyncIOScheduler()
+QR_MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
 
+# qr_cache maps (data, format) to (content, etag)
+qr_cache = LRUCache(config.qr_cache_size)
 
-async def create_qr_code_and_upload(image_id, current_user, db):
-    image = await image_exists(image_id, current_user, db)
-    if image:
-        image = image.image
 
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(image)
-        qr.make(fit=True)
+def render_qr_code(data: str, fmt: str = "png") -> bytes:
+    """
+    Renders QR code in memory.
+
+    Args:
+        data (str): Data to encode, like image url.
+        fmt (str): "png" or "svg".
+
+    Returns:
+        bytes: Rendered QR code.
+    """
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    if fmt == "svg":
+        qr_image = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+    else:
         qr_image = qr.make_image(fill_color="black", back_color="white")
+    output = BytesIO()
+    qr_image.save(output)
+    return output.getvalue()
+
+
+def qr_etag(content: bytes) -> str:
+    return '"' + hashlib.sha256(content).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Checks If-None-Match header against ETag by weak comparison, so weak
+    validators ("W/" prefix) of the same entity tag match too.
+
+    Args:
+        if_none_match (str): Value of If-None-Match header.
+        etag (str): Current ETag.
+
+    Returns:
+        bool: True if client has the current representation.
+    """
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(",")
+    )
+
+
+async def qr_code(data: str, fmt: str = "png") -> tuple[bytes, str]:
+    """
+    Gets QR code from qr_cache, it is rendered only on cache miss.
+
+    Args:
+        data (str): Data to encode, like image url.
+        fmt (str): "png" or "svg".
+
+    Returns:
+        tuple[bytes, str]: QR code and its ETag derived from content.
+    """
+    key = (data, fmt)
+    cached = qr_cache.get(key)
+    if cached is None:
+        content = await run_in_threadpool(render_qr_code, data, fmt)
+        cached = (content, qr_etag(content))
+        qr_cache.set(key, cached)
+    return cached
+
+
+async def qr_codes(datas: List[str], fmt: str = "png") -> AsyncIterator[bytes]:
+    """
+    Renders many QR codes in parallel on the process pool. Codes are rendered
+    by windows of config.worker_processes items and yielded in order, so only
+    one window is kept in memory.
+
+    Args:
+        datas (List[str]): Data to encode, like image urls.
+        fmt (str): "png" or "svg".
+
+    Yields:
+        bytes: Rendered QR code for each item of datas.
+    """
+    window = max(config.worker_processes, 1)
+    for start in range(0, len(datas), window):
+        chunk = datas[start:start + window]
+        cached = [qr_cache.get((data, fmt)) for data in chunk]
+        futures = [
+            None if hit
+            else asyncio.create_task(run_in_process(render_qr_code, data, fmt))
+            for data, hit in zip(chunk, cached)
+        ]
+        for data, hit, future in zip(chunk, cached, futures):
+            if hit is None:
+                content = await future
+                hit = (content, qr_etag(content))
+                qr_cache.set((data, fmt), hit)
+            yield hit[0]
+
+
+class _ZipStream:
+    """Unseekable file which keeps bytes written by ZipFile until they are sent"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def pop(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def qr_zip_stream(names: List[str], datas: List[str]) -> AsyncIterator[bytes]:
+    """
+    Streams ZIP archive of PNG QR codes. Each code is sent as soon as it is
+    rendered, so the whole archive is never kept in memory.
+
+    Args:
+        names (List[str]): File names in archive.
+        datas (List[str]): Data to encode, like image urls.
+
+    Yields:
+        bytes: Next part of ZIP archive.
+    """
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_STORED) as archive:
+        index = 0
+        async for content in qr_codes(datas, "png"):
+            archive.writestr(names[index], content)
+            index += 1
+            yield stream.pop()
+    yield stream.pop()
 
-        qr_image.save(f"{image_id, current_user.username}")
 
-        result = cloudinary.uploader.upload(f"{image_id, current_user.username}")
-        # print(result["public_id"])
-        os.remove(f"{image_id, current_user.username}")
+def compose_qr_sheet(codes: List[bytes], fmt: str = "png") -> bytes:
+    """
+    Composes PNG QR codes into one sheet (grid). It is run in the process pool.
 
-        future_time = datetime.now() + timedelta(minutes=30)
-        scheduler.add_job(
-            delete_temp_qr_code,
-            "date",
-            run_date=future_time,
-            args=[result["public_id"]],
-        )
+    Args:
+        codes (List[bytes]): PNG QR codes.
+        fmt (str): "png" or "pdf".
 
-        return result["secure_url"]
-    raise HTTPException(status_code=400, detail="Image doesn't exist")
+    Returns:
+        bytes: Sheet with all QR codes.
+    """
+    images = [PILImage.open(BytesIO(code)).convert("L") for code in codes]
+    tile = max(max(image.size) for image in images)
+    columns = math.ceil(math.sqrt(len(images)))
+    rows = math.ceil(len(images) / columns)
+    sheet = PILImage.new("L", (columns * tile, rows * tile), 255)
+    for index, image in enumerate(images):
+        row, column = divmod(index, columns)
+        sheet.paste(image, (column * tile, row * tile))
+    output = BytesIO()
+    sheet.save(output, format=fmt.upper())
+    return output.getvalue()
 
 
-async def delete_temp_qr_code(public_id):
-    try:
-        cloudinary.uploader.destroy(public_id)
-    except Exception as e:
-        print(f"Error while image deletion in Cloudinary: {e}")
+async def qr_sheet(datas: List[str], fmt: str = "png") -> bytes:
+    """
+    Renders QR codes on the process pool and composes them into one sheet.
 
+    Args:
+        datas (List[str]): Data to encode, like image urls.
+        fmt (str): "png" or "pdf".
 
-scheduler.start()
+    Returns:
+        bytes: Sheet with all QR codes.
+    """
+    codes = [content async for content in qr_codes(datas, "png")]
+    return await run_in_process(compose_qr_sheet, codes, fmt)
@@ -0,0 +1,41 @@
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from src.conf.config import config
+from src.services.assets import run_asset_deletions
+from src.services.maintenance import repair_image_counters
+
+# Deferred work is stored in the database (like asset_deletions rows with
+# next_attempt_at), so it survives restarts. The scheduler only runs periodic
+# sweeps which process all due work of the same kind in batches. Missed runs
+# are coalesced into one, and the same sweep never runs concurrently.
+scheduler = AsyncIOScheduler(
+    job_defaults={"coalesce": True, "max_instances": 1, "misfire_grace_time": None}
+)
+
+
+def start_scheduler() -> None:
+    """
+    Register periodic sweeps and start the scheduler. It must be called
+    from the running event loop, like on application startup.
+    """
+    scheduler.add_job(
+        run_asset_deletions,
+        "interval",
+        seconds=config.asset_deletion_interval,
+        id="asset_deletions",
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        repair_image_counters,
+        "interval",
+        seconds=config.counters_repair_interval,
+        id="counters_repair",
+        replace_existing=True,
+    )
+    scheduler.start()
+
+
+def shutdown_scheduler() -> None:
+    """Stop the scheduler without waiting for running sweeps."""
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
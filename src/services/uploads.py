@@ -0,0 +1,206 @@
+from io import BytesIO
+
+from fastapi import HTTPException, UploadFile, status
+from PIL import Image as PILImage, ImageOps
+
+from src.conf.config import config
+from src.services.pool import run_in_process
+
+# Formats which are tried in order when configured format is unavailable
+FALLBACK_FORMATS = ("AVIF", "WEBP", "JPEG")
+
+# Uploaded file is read by chunks, the first chunk must contain image header
+CHUNK_SIZE = 64 * 1024
+
+MAGIC_NUMBERS = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"BM", "BMP"),
+    (b"II*\x00", "TIFF"),
+    (b"MM\x00*", "TIFF"),
+)
+# ISO BMFF brands (bytes 8-12 after "ftyp" box type)
+HEIF_BRANDS = (b"avif", b"avis", b"heic", b"heix", b"mif1", b"msf1")
+
+
+def sniff_format(header: bytes) -> str | None:
+    """
+    Detects image format by magic bytes in the beginning of file. Formats
+    which installed Pillow is unable to open (like AVIF before Pillow 11.2,
+    or HEIF without a plugin) are not supported.
+
+    Args:
+        header (bytes): The first bytes of file (at least 12).
+
+    Returns:
+        str | None: Image format, or None if file is not a supported image.
+    """
+    fmt = None
+    for magic, magic_fmt in MAGIC_NUMBERS:
+        if header.startswith(magic):
+            fmt = magic_fmt
+            break
+    else:
+        if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+            fmt = "WEBP"
+        elif header[4:8] == b"ftyp" and header[8:12] in HEIF_BRANDS:
+            fmt = "AVIF" if header[8:12] in (b"avif", b"avis") else "HEIF"
+    PILImage.init()
+    return fmt if fmt in PILImage.OPEN else None
+
+
+def image_dimensions(data: bytes) -> tuple[int, int] | None:
+    """
+    Reads image dimensions from header. Pillow opens image lazily, so pixels
+    are not decoded.
+
+    Args:
+        data (bytes): Beginning of image or the whole image.
+
+    Returns:
+        tuple[int, int] | None: Width and height, or None if header is
+        incomplete or damaged.
+    """
+    try:
+        with PILImage.open(BytesIO(data)) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def check_dimensions(dimensions: tuple[int, int]) -> None:
+    width, height = dimensions
+    if width * height > config.upload_max_pixels:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Image {width}x{height} is too large.",
+        )
+
+
+async def read_upload(file: UploadFile) -> bytes:
+    """
+    Reads uploaded image by chunks and validates it. The file is already
+    received and spooled by the form parser (its request body is limited by
+    LimitUploadSize middleware), so chunks only keep memory bounded and stop
+    reading early: non-image files are rejected by the first chunk, too big
+    files are rejected as soon as config.upload_max_size is exceeded, and
+    dimensions are checked as soon as image header is read.
+
+    Args:
+        file (UploadFile): Uploaded image.
+
+    Returns:
+        bytes: Validated image.
+
+    Raises:
+        HTTPException: If file is too big, is not an image, or image
+        dimensions are too large.
+    """
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File size must not exceed {config.upload_max_size} bytes.",
+    )
+    if file.size is not None and file.size > config.upload_max_size:
+        raise too_large
+
+    chunk = await file.read(CHUNK_SIZE)
+    if sniff_format(chunk) is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="File is not a supported image.",
+        )
+    dimensions = image_dimensions(chunk)
+    if dimensions:
+        check_dimensions(dimensions)
+
+    chunks, size = [], 0
+    while chunk:
+        size += len(chunk)
+        if size > config.upload_max_size:
+            raise too_large
+        chunks.append(chunk)
+        chunk = await file.read(CHUNK_SIZE)
+    data = b"".join(chunks)
+
+    if dimensions is None:
+        # Header is bigger than the first chunk (like JPEG with large EXIF)
+        dimensions = image_dimensions(data)
+        if dimensions is None:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Image is damaged.",
+            )
+        check_dimensions(dimensions)
+    return data
+
+
+def saving_format(image_format: str) -> str:
+    """
+    Get the first format Pillow is able to save, starting with image_format.
+
+    Args:
+        image_format (str): Preferred format, like "WEBP" or "AVIF".
+
+    Returns:
+        str: Available format.
+    """
+    PILImage.init()
+    image_format = image_format.upper()
+    for fmt in (image_format,) + FALLBACK_FORMATS:
+        if fmt in PILImage.SAVE:
+            return fmt
+    return "JPEG"
+
+
+def reencode_image(data: bytes, image_format: str, quality: int) -> bytes:
+    """
+    Strips metadata, applies EXIF orientation and re-encodes image.
+    It is CPU bound, so it is run in the process pool. The original image
+    is kept when re-encoding does not make it smaller.
+
+    Args:
+        data (bytes): Original image.
+        image_format (str): Preferred format of re-encoded image.
+        quality (int): Encoding quality (1-100).
+
+    Returns:
+        bytes: Re-encoded image, or original image when it is animated or
+        is not bigger than re-encoded one.
+    """
+    with PILImage.open(BytesIO(data)) as image:
+        if getattr(image, "is_animated", False):
+            return data
+        fmt = saving_format(image_format)
+        image = ImageOps.exif_transpose(image)
+        if fmt == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+            transparent = "transparency" in image.info or "A" in image.getbands()
+            image = image.convert("RGBA" if transparent else "RGB")
+        output = BytesIO()
+        # Metadata (EXIF, ICC thumbnails, XMP, etc.) is not passed to save()
+        image.save(output, format=fmt, quality=quality)
+    reencoded = output.getvalue()
+    return reencoded if len(reencoded) < len(data) else data
+
+
+async def prepare_upload(file: UploadFile) -> tuple[bytes, int]:
+    """
+    Reads and validates uploaded image, and re-encodes it when
+    config.upload_processing is on.
+
+    Args:
+        file (UploadFile): Uploaded image.
+
+    Returns:
+        tuple[bytes, int]: Image to store and size of original image in bytes.
+    """
+    data = await read_upload(file)
+    original_size = len(data)
+    if config.upload_processing:
+        data = await run_in_process(
+            reencode_image, data, config.upload_format, config.upload_quality
+        )
+    return data, original_size
@@ -0,0 +1,110 @@
+from typing import Iterable
+
+import cloudinary
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import config
+from src.database.models import User
+from src.repository import images as repository_images
+from src.services.cache import LRUCache
+from src.services.events import comment_events
+
+# variant_cache maps (image_id, width, height, crop) to (url, owner_id)
+variant_cache = LRUCache(config.variant_cache_size)
+
+# Evictions are broadcast, so other workers drop their cached urls too
+EVICT_CHANNEL = "variants:evict"
+
+
+def build_variant_url(
+    public_id: str,
+    version: int,
+    width: int | None = None,
+    height: int | None = None,
+    crop: str | None = None,
+) -> str:
+    """
+    Builds cloudinary url of image transformation.
+
+    Args:
+        public_id (str): Cloudinary public ID of image.
+        version (int): Cloudinary version of image.
+        width (int | None): Width of transformed image.
+        height (int | None): Height of transformed image.
+        crop (str | None): Cloudinary crop mode.
+
+    Returns:
+        str: Url of transformed image.
+    """
+    options = {"version": version}
+    if crop:
+        options.update(width=width, height=height, crop=crop)
+    return cloudinary.CloudinaryImage(public_id).build_url(**options)
+
+
+def _evict(image_ids: Iterable[int]) -> None:
+    image_ids = set(image_ids)
+    variant_cache.pop_where(lambda key: key[0] in image_ids)
+
+
+comment_events.handle(EVICT_CHANNEL, lambda message: _evict(message["image_ids"]))
+
+
+async def variant_cache_evict(image_ids: Iterable[int]) -> None:
+    """
+    Drops cached variant urls of deleted images in this and all other
+    workers, so they are not served from the cache after deletion.
+
+    Args:
+        image_ids (Iterable[int]): IDs of deleted images.
+    """
+    image_ids = sorted(set(image_ids))
+    if image_ids:
+        _evict(image_ids)
+        await comment_events.broadcast(EVICT_CHANNEL, {"image_ids": image_ids})
+
+
+async def image_variant_url(
+    image_id: int, width: int, height: int, crop: str, user: User, db: AsyncSession
+) -> str | None:
+    """
+    Gets url of image variant for the image owner. Url is looked up in
+    variant_cache, then in image_variants table, and it is built and
+    stored only when both lookups miss.
+
+    Args:
+        image_id (int): The ID of image.
+        width (int): Width of image variant.
+        height (int): Height of image variant.
+        crop (str): Cloudinary crop mode.
+        user (User): Image owner.
+        db (AsyncSession): The database session.
+
+    Returns:
+        str | None: Url of image variant, or None if image is absent or
+        belongs to another user.
+    """
+    key = (image_id, width, height, crop)
+    variant = variant_cache.get(key)
+    if variant is None:
+        variant = await repository_images.image_variant_read(
+            image_id, width, height, crop, db
+        )
+        if variant is not None:
+            variant = tuple(variant)
+    if variant is None:
+        image = await repository_images.image_exists(image_id, user, db)
+        if image is None:
+            return None
+        url = build_variant_url(
+            image.cloud_public_id, image.cloud_version, width, height, crop
+        )
+        await repository_images.image_variant_create(
+            image_id, width, height, crop, url, db
+        )
+        variant = (url, image.user_id)
+    url, owner_id = variant
+    variant_cache.set(key, (url, owner_id))
+    if owner_id != user.id:
+        return None
+    return url
@@ -0,0 +1,152 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select, update
+
+from src.database.models import Comment, EmometerJob, Image, ImageEmotionStats
+from src.repository import comments as repository_comments
+from src.repository.emometer import EMO_FIELDS, emometer_job_enqueue
+from src.services.pagination import decode_cursor, encode_cursor
+from tests.conftest import create_user_image, session_maker
+
+BENCHMARK_COMMENTS = 400
+BENCHMARK_CLIENTS = 8
+
+
+async def legacy_create_comment(text, user_id, image_id, db):
+    """Comment creation before the single statement: route check and ORM insert."""
+    image = await db.get(Image, image_id)
+    if image is None:
+        return None
+    comment = Comment(comment=text, user_id=user_id, image_id=image_id)
+    db.add(comment)
+    sq = (
+        update(Image)
+        .where(Image.id == image_id)
+        .values(comment_count=Image.comment_count + 1, updated_at=Image.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(sq)
+    await db.flush()
+    await emometer_job_enqueue(comment.id, db)
+    await db.commit()
+    await db.refresh(comment)
+    return comment
+
+
+def test_create_comment(postgres_url):
+    async def scenario():
+        engine, sessions = session_maker(postgres_url)
+        try:
+            async with sessions() as db:
+                user, image = await create_user_image(db, "commenter")
+                queued = await repository_comments.create_comment(
+                    "queued", user.id, image.id, db
+                )
+                rated = await repository_comments.create_comment(
+                    "rated", user.id, image.id, db, rates=(10, 20, 30, 40, 50, 60)
+                )
+                absent = await repository_comments.create_comment(
+                    "absent", user.id, image.id + 1000, db
+                )
+                jobs = (await db.execute(select(EmometerJob))).scalars().all()
+                stats = await db.get(ImageEmotionStats, image.id)
+                count = await db.scalar(
+                    select(Image.comment_count).where(Image.id == image.id)
+                )
+            return queued, rated, absent, jobs, stats, count
+        finally:
+            await engine.dispose()
+
+    queued, rated, absent, jobs, stats, count = asyncio.run(scenario())
+
+    assert absent is None
+    assert count == 2
+    assert queued.revision == 1 and queued.rated_at is None
+    assert [getattr(queued, field) for field in EMO_FIELDS] == [0] * 6
+    assert [(job.comment_id, job.attempts) for job in jobs] == [(queued.id, 0)]
+    assert rated.revision == 1 and rated.rated_at is not None
+    assert [getattr(rated, field) for field in EMO_FIELDS] == [10, 20, 30, 40, 50, 60]
+    assert (stats.count, stats.sum_joy, stats.sum_fear) == (1, 10, 60)
+
+
+@pytest.mark.benchmark
+def test_create_comment_throughput(postgres_url):
+    """
+    Compares comments per second of the single statement with the former
+    multi-statement creation. Run with "pytest -s -m benchmark" to see them.
+    """
+
+    async def measure(create, name):
+        engine, sessions = session_maker(postgres_url, BENCHMARK_CLIENTS)
+        try:
+            async with sessions() as db:
+                user, image = await create_user_image(db, name)
+
+            async def client(amount):
+                async with sessions() as db:
+                    for i in range(amount):
+                        assert await create(f"comment {i}", user.id, image.id, db)
+
+            per_client = BENCHMARK_COMMENTS // BENCHMARK_CLIENTS
+            started = time.perf_counter()
+            await asyncio.gather(*(client(per_client) for _ in range(BENCHMARK_CLIENTS)))
+            elapsed = time.perf_counter() - started
+
+            async with sessions() as db:
+                count = await db.scalar(
+                    select(func.count(Comment.id)).where(Comment.image_id == image.id)
+                )
+                counter = await db.scalar(
+                    select(Image.comment_count).where(Image.id == image.id)
+                )
+            assert count == counter == per_client * BENCHMARK_CLIENTS
+            return count / elapsed
+        finally:
+            await engine.dispose()
+
+    before = asyncio.run(measure(legacy_create_comment, "benchmark_before"))
+    after = asyncio.run(measure(repository_comments.create_comment, "benchmark_after"))
+    print(
+        f"\ncreate_comment, {BENCHMARK_CLIENTS} clients: "
+        f"{before:.0f} comments/s before, {after:.0f} comments/s after"
+    )
+
+
+def test_get_comments_for_image_pages(postgres_url):
+    """Pages by (created_at, id) cursor skip and repeat no comment on ties."""
+
+    async def scenario():
+        engine, sessions = session_maker(postgres_url)
+        try:
+            async with sessions() as db:
+                user, image = await create_user_image(db, "pager")
+                same_time = datetime(2026, 10, 19, 12, 0)
+                db.add_all(
+                    Comment(
+                        comment=f"page {i}", user_id=user.id, image_id=image.id,
+                        created_at=same_time + timedelta(minutes=i // 2),
+                    )
+                    for i in range(5)
+                )
+                await db.commit()
+                pages, after = [], None
+                while True:
+                    rows = await repository_comments.get_comments_for_image(
+                        image.id, db, 2, after
+                    )
+                    if not rows:
+                        break
+                    pages.append([row.comment for row in rows])
+                    after = decode_cursor(
+                        encode_cursor(rows[-1].created_at, rows[-1].id)
+                    )
+            return pages
+        finally:
+            await engine.dispose()
+
+    pages = asyncio.run(scenario())
+
+    assert pages == [["page 4", "page 3"], ["page 2", "page 1"], ["page 0"]]
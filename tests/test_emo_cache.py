@@ -0,0 +1,61 @@
+import asyncio
+
+from redis.exceptions import ConnectionError
+
+from src.services.emo_cache import EmoScoreCache, comment_key, normalize_comment
+
+
+class DictRedis:
+    """Redis stand-in which keeps values in a dict."""
+
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value.encode()
+
+
+class BrokenRedis:
+    async def get(self, key):
+        raise ConnectionError("Redis is down")
+
+    async def set(self, key, value, ex=None):
+        raise ConnectionError("Redis is down")
+
+
+def test_normalize_comment():
+    assert normalize_comment("  Niiiice   picture !!!") == "niice picture!!"
+    assert comment_key("Nice!!!") == comment_key("nice !!") == comment_key("NICE!!!!")
+    assert comment_key("nice") != comment_key("nice!")
+
+
+def test_emo_score_cache():
+    rates = (10, 20, 30, 40, 50, 60)
+    shared = DictRedis()
+
+    async def scenario():
+        writer, reader = EmoScoreCache(), EmoScoreCache()
+        writer._redis = reader._redis = shared
+        await writer.set("Nice!!!", rates)
+        # another worker reads it from Redis and keeps it in its LRU cache
+        found = await reader.get("nice !!")
+        shared.values.clear()
+        return found, await reader.get("NICE!!"), await reader.get("other")
+
+    assert asyncio.run(scenario()) == (rates, rates, None)
+
+
+def test_emo_score_cache_without_redis():
+    """Local LRU cache still works when Redis is unavailable."""
+    rates = (1, 2, 3, 4, 5, 6)
+
+    async def scenario():
+        cache = EmoScoreCache()
+        cache._redis = BrokenRedis()
+        await cache.set("fine", rates)
+        return await cache.get("Fine"), await cache.get("missing")
+
+    assert asyncio.run(scenario()) == (rates, None)
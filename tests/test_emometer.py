@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from src.services.emometer import (
+    EmotionScorer,
+    HybridScorer,
+    LexiconScorer,
+    LLMScorer,
+    get_scorer,
+    parse_answer,
+    parse_json_answer,
+)
+
+LOVE = (90, 0, 0, 0, 0, 0)
+ANGRY_SAD = (0, 45, 45, 0, 0, 0)
+REMOTE = (1, 2, 3, 4, 5, 6)
+
+
+class StubLLMScorer(EmotionScorer):
+    """ChatGPT scorer stand-in which records rated comments."""
+
+    def __init__(self, answers=None, error=None):
+        self.answers = answers
+        self.error = error
+        self.calls = []
+
+    async def score(self, comments):
+        self.calls.append(comments)
+        if self.error:
+            raise self.error
+        return self.answers or [REMOTE] * len(comments)
+
+
+def test_lexicon_scorer():
+    rates = asyncio.run(
+        LexiconScorer().score(["Love!", "angry, SAD", "qwerty asdf"])
+    )
+    assert rates == [LOVE, ANGRY_SAD, (0,) * 6]
+
+
+def test_hybrid_scorer_prefilter():
+    """Well covered comments are rated locally, the rest by ChatGPT."""
+    scorer = HybridScorer(prefilter=True)
+    scorer.llm = StubLLMScorer(answers=[REMOTE, None])
+    rates = asyncio.run(scorer.score(["love", "I love this", "angry sad", "qwerty"]))
+
+    assert scorer.llm.calls == [["I love this", "qwerty"]]
+    # comment which ChatGPT has not rated falls back to the lexicon
+    assert rates == [LOVE, REMOTE, ANGRY_SAD, (0,) * 6]
+
+
+def test_hybrid_scorer_fallback():
+    """Without prefilter everything goes to ChatGPT, the lexicon is fallback."""
+    scorer = HybridScorer(prefilter=False)
+    scorer.llm = StubLLMScorer()
+    assert asyncio.run(scorer.score(["love", "qwerty"])) == [REMOTE, REMOTE]
+
+    scorer.llm = StubLLMScorer(error=TimeoutError())
+    assert asyncio.run(scorer.score(["love", "angry sad"])) == [LOVE, ANGRY_SAD]
+
+
+def test_get_scorer():
+    assert isinstance(get_scorer("llm"), LLMScorer)
+    assert isinstance(get_scorer("lexicon"), LexiconScorer)
+    assert get_scorer("hybrid").prefilter and not get_scorer("fallback").prefilter
+    with pytest.raises(ValueError):
+        get_scorer("lexikon")
+    with pytest.raises(TypeError):
+        EmotionScorer()
+
+
+def test_parse_answer():
+    answer = (
+        "Sure! Here are the rates:\n"
+        "1. <(@joy: 10%@)> <(@anger: 20%@)> <(@sadness: 30%@)> "
+        "<(@surprise: 40%@)> <(@disgust: 50%@)> <(@fear: 60%@)>\n"
+        "2) Joy - 5 %, Anger 0%, sadness: 1%, surprise: 2%, disgust: 3%,\n"
+        "   fear: 4%, joy: 99%\n"
+        "3. joy: 1%, anger: 2%\n"
+        "4. joy: 101%, anger: 0%, sadness: 0%, surprise: 0%, disgust: 0%, fear: 0%\n"
+        "7. joy: 1%, anger: 1%, sadness: 1%, surprise: 1%, disgust: 1%, fear: 1%\n"
+    )
+    scores, errors = parse_answer(answer, 5)
+
+    # rates may continue on the next line, the first rate of emotion is kept
+    assert scores == {1: (10, 20, 30, 40, 50, 60), 2: (5, 0, 1, 2, 3, 4)}
+    assert errors == {
+        3: "no rates of sadness, surprise, disgust, fear",
+        4: "rates of joy are above 100%",
+    }
+
+
+def test_parse_answer_single():
+    """Rates of the only message may go without number."""
+    answer = "joy 10%, anger 0%, sadness 0%, surprise 70%, disgust 0%, fear 5%"
+    assert parse_answer(answer, 1) == ({1: (10, 0, 0, 70, 0, 5)}, {})
+    assert parse_answer(answer, 2) == ({}, {})
+
+
+def test_parse_json_answer():
+    answer = (
+        "```json\n"
+        '{"1": {"joy": 10, "anger": 20, "sadness": 30, "surprise": 40,'
+        ' "disgust": 50, "fear": 60},'
+        ' "2": {"joy": 150, "anger": 0, "sadness": 0, "surprise": 0,'
+        ' "disgust": 0, "fear": 0},'
+        ' "3": {"joy": 1},'
+        ' "9": {}, "note": "ok"}\n'
+        "```"
+    )
+    scores, errors = parse_json_answer(answer, 3)
+
+    assert scores == {1: (10, 20, 30, 40, 50, 60)}
+    assert errors[2] == "joy: Input should be less than or equal to 100"
+    assert errors[3].startswith("anger: Field required; sadness: Field required")
+    assert set(errors) == {2, 3}
+
+
+@pytest.mark.parametrize("answer", ["joy: 10%", "[1, 2]", '{"1": {"joy": 1}'])
+def test_parse_json_answer_not_object(answer):
+    with pytest.raises(ValueError):
+        parse_json_answer(answer, 1)
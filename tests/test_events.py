@@ -0,0 +1,84 @@
+import asyncio
+
+from redis.exceptions import ConnectionError
+
+from src.services import events
+from src.services.events import OVERFLOW, CommentEventHub, Subscription
+
+
+def test_subscription_overflow():
+    """Slow subscriber gets OVERFLOW instead of pending events."""
+
+    async def scenario():
+        subscription = Subscription(2)
+        subscription.put({"type": "created", "id": 1})
+        first = await subscription.get(0.01)
+        for i in range(2, 5):
+            subscription.put({"type": "created", "id": i})
+        # events after overflow are ignored, the client reloads the thread
+        subscription.put({"type": "created", "id": 5})
+        return first, await subscription.get(0.01), await subscription.get(0.01)
+
+    first, overflow, empty = asyncio.run(scenario())
+
+    assert first == {"type": "created", "id": 1}
+    assert overflow is OVERFLOW
+    assert empty is None
+
+
+class FakePubSub:
+    def __init__(self, broken: bool):
+        self.broken = broken
+        self.closed = False
+
+    async def psubscribe(self, *patterns):
+        if self.broken:
+            raise ConnectionError("Redis is down")
+
+    async def subscribe(self, *channels):
+        pass
+
+    async def listen(self):
+        await asyncio.Event().wait()
+        yield
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeRedis:
+    instances = []
+
+    def __init__(self, **options):
+        self.pubsubs = []
+        self.closed = False
+        FakeRedis.instances.append(self)
+
+    def pubsub(self, **options):
+        # the first two subscriptions fail
+        self.pubsubs.append(FakePubSub(broken=len(self.pubsubs) < 2))
+        return self.pubsubs[-1]
+
+    async def close(self):
+        self.closed = True
+
+
+def test_listen_closes_broken_subscriptions(monkeypatch):
+    monkeypatch.setattr(events.redis, "Redis", FakeRedis)
+    sleep = asyncio.sleep
+    monkeypatch.setattr(events.asyncio, "sleep", lambda delay: sleep(0))
+
+    async def scenario():
+        hub = CommentEventHub()
+        hub.start()
+        listener = None
+        while listener is None or len(listener.pubsubs) < 3:
+            await sleep(0)
+            listener = FakeRedis.instances[-1] if FakeRedis.instances else None
+        await hub.stop()
+        return listener
+
+    listener = asyncio.run(scenario())
+
+    assert [pubsub.closed for pubsub in listener.pubsubs] == [True, True, True]
+    assert listener.closed
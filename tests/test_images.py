@@ -0,0 +1,99 @@
+import asyncio
+
+from sqlalchemy import func, select
+
+from src.database.models import AssetDeletion, Comment, Image, Star, Tag, tag_m2m_image
+from src.repository import comments as repository_comments
+from src.repository import images as repository_images
+from tests.conftest import create_user_image, session_maker
+
+
+def test_images_delete(postgres_url):
+    """Images are deleted by one statement with cascades and asset outbox."""
+
+    async def scenario():
+        engine, sessions = session_maker(postgres_url)
+        try:
+            async with sessions() as db:
+                owner, first = await create_user_image(db, "delete_first")
+                _, second = await create_user_image(db, "delete_second")
+                stranger, foreign = await create_user_image(db, "delete_foreign")
+                second.user_id = owner.id
+                db.add(Tag(name="delete tag"))
+                await db.commit()
+                for image in (first, second, foreign):
+                    await repository_comments.create_comment(
+                        "to delete", owner.id, image.id, db
+                    )
+                    db.add(Star(level=5, user_id=stranger.id, image_id=image.id))
+                    tagger = stranger if image is foreign else owner
+                    await repository_images.image_add_tag(
+                        image.id, "delete tag", tagger, db
+                    )
+                await db.commit()
+
+                deleted = await repository_images.images_delete(
+                    [first.id, second.id, foreign.id, foreign.id + 1000], owner, db
+                )
+                images = (await db.execute(select(Image.id))).scalars().all()
+                ids = [first.id, second.id, foreign.id]
+                counts = [
+                    await db.scalar(
+                        select(func.count()).select_from(table).where(
+                            table.c.image_id.in_(ids)
+                        )
+                    )
+                    for table in (Comment.__table__, Star.__table__, tag_m2m_image)
+                ]
+                outbox = (
+                    await db.execute(
+                        select(AssetDeletion.cloud_public_id, AssetDeletion.attempts)
+                        .where(AssetDeletion.cloud_public_id.like("delete_%"))
+                    )
+                ).all()
+            return [first.id, second.id], foreign.id, deleted, images, counts, outbox
+        finally:
+            await engine.dispose()
+
+    owned, foreign_id, deleted, images, counts, outbox = asyncio.run(scenario())
+
+    assert deleted == owned
+    assert foreign_id in images and not set(owned) & set(images)
+    assert counts == [1, 1, 1]
+    assert sorted(outbox) == [("delete_first", 0), ("delete_second", 0)]
+
+
+def test_images_create(postgres_url):
+    """Records of stored assets are skipped and those assets are kept."""
+
+    async def scenario():
+        engine, sessions = session_maker(postgres_url)
+        try:
+            async with sessions() as db:
+                user, _ = await create_user_image(db, "create_stored")
+                records = [
+                    {
+                        "image": f"https://example.com/{name}.webp",
+                        "small_image": f"https://example.com/{name}.small.webp",
+                        "cloud_public_id": public_id,
+                        "cloud_version": 1,
+                    }
+                    for name, public_id in (
+                        ("create_new", "create_new"),
+                        ("create_again", "create_stored"),
+                    )
+                ]
+                images = await repository_images.images_create(records, user, db)
+                outbox = await db.scalar(
+                    select(func.count()).select_from(AssetDeletion).where(
+                        AssetDeletion.cloud_public_id.like("create_%")
+                    )
+                )
+            return [image.cloud_public_id for image in images], outbox
+        finally:
+            await engine.dispose()
+
+    stored, outbox = asyncio.run(scenario())
+
+    assert stored == ["create_new"]
+    assert outbox == 0
@@ -0,0 +1,153 @@
+import asyncio
+import socket
+import threading
+import time
+
+import openai
+import pytest
+import uvicorn
+
+from src.conf.config import config
+from src.services import fake_llm
+from src.services.llm import LLMClient, TokenBucket
+
+PROMPT = "1. &&&Nice picture&&&.\n"
+
+
+@pytest.fixture(scope="module")
+def fake_llm_url():
+    """Base url of the fake ChatGPT server running in a thread."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(
+        uvicorn.Config(fake_llm.app, host="127.0.0.1", port=port, log_level="error")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{port}/v1"
+    server.should_exit = True
+    thread.join()
+
+
+@pytest.fixture
+def fake(fake_llm_url, monkeypatch):
+    """Fake server settings and counters, reset for each test."""
+    monkeypatch.setattr(openai, "api_base", fake_llm_url)
+    monkeypatch.setattr(fake_llm, "settings", fake_llm.FakeSettings(latency_ms=0))
+    monkeypatch.setattr(fake_llm, "stats", dict.fromkeys(fake_llm.stats, 0))
+    fake_llm.requests.clear()
+    for name, value in {
+        "llm_concurrency": 4, "llm_rpm": 3500, "llm_tpm": 90000,
+        "llm_timeout": 5.0, "llm_retries": 2, "llm_backoff": 0.01,
+        "llm_backoff_max": 0.02,
+    }.items():
+        monkeypatch.setattr(config, name, value)
+    return fake_llm
+
+
+def complete_many(client: LLMClient, amount: int, **options) -> tuple[list, float]:
+    async def scenario():
+        started = time.perf_counter()
+        answers = await asyncio.gather(
+            *(client.complete(PROMPT, **options) for _ in range(amount))
+        )
+        return answers, time.perf_counter() - started
+
+    return asyncio.run(scenario())
+
+
+def test_complete(fake):
+    client = LLMClient()
+    (text,), _ = complete_many(client, 1)
+    (json_text,), _ = complete_many(client, 1, json_mode=True)
+    assert text.startswith("1. <(@joy: ")
+    assert json_text.startswith('{"1": {"joy": ')
+    assert fake.stats["requests"] == 2
+
+
+def test_rpm_throttling(fake, monkeypatch):
+    """Requests above RPM wait for the bucket instead of hitting 429."""
+    monkeypatch.setattr(config, "llm_rpm", 600)
+    client = LLMClient()
+    client._requests._tokens = 0  # the burst is spent, 10 requests per second
+    _, elapsed = complete_many(client, 5)
+    assert elapsed >= 0.45
+    assert fake.stats["requests"] == 5 and fake.stats["rejected"] == 0
+
+
+def test_tpm_throttling(fake, monkeypatch):
+    """Requests wait until prompt and completion tokens fit into TPM."""
+    monkeypatch.setattr(config, "llm_tpm", 6000)
+    client = LLMClient()
+    client._tokens._tokens = 0  # the burst is spent, 100 tokens per second
+    # PROMPT is 6 estimated tokens, so each request takes 0.2 seconds
+    _, elapsed = complete_many(client, 3, completion_tokens=14)
+    assert elapsed >= 0.55
+    assert fake.stats["requests"] == 3
+
+
+def test_timeout(fake, monkeypatch):
+    """Slow answers are cancelled by wait_for and retried."""
+    fake.settings.latency_ms = 1000
+    monkeypatch.setattr(config, "llm_timeout", 0.1)
+    started = time.perf_counter()
+    with pytest.raises((asyncio.TimeoutError, openai.error.Timeout)):
+        complete_many(LLMClient(), 1)
+    assert time.perf_counter() - started < 1
+    # give cancelled requests time to be counted by the server
+    time.sleep(0.1)
+    assert fake.stats["requests"] == config.llm_retries + 1
+
+
+def test_retry_rate_limited(fake):
+    """429 answers are retried, and the last one is raised."""
+    fake.settings.rpm = 1
+    client = LLMClient()
+    complete_many(client, 1)
+    with pytest.raises(openai.error.RateLimitError):
+        complete_many(client, 1)
+    assert fake.stats["requests"] == 1
+    assert fake.stats["rejected"] == config.llm_retries + 1
+
+
+def test_retry_server_error(fake, monkeypatch):
+    """5xx answers are retried until one succeeds."""
+    errors = iter([0.0, 0.0, 1.0])
+    monkeypatch.setattr(fake.random, "random", lambda: next(errors))
+    fake.settings.error_rate = 0.5
+    (text,), _ = complete_many(LLMClient(), 1)
+    assert text.startswith("1. <(@joy: ")
+    assert fake.stats["failed"] == 2 and fake.stats["requests"] == 3
+
+
+def test_token_bucket():
+    """Burst is served at once, then units are refilled at rate per minute."""
+
+    async def scenario():
+        bucket = TokenBucket(600)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        # amount above capacity is limited by it instead of waiting forever
+        await bucket.acquire(6000)
+        burst = loop.time() - started
+        order = []
+
+        async def take(name, amount):
+            await bucket.acquire(amount)
+            order.append((name, loop.time() - started))
+
+        await asyncio.gather(take("first", 1), take("second", 2), take("third", 1))
+        return burst, order
+
+    burst, order = asyncio.run(scenario())
+
+    # 10 units per second, waiters are served in FIFO order
+    assert burst < 0.05
+    assert [name for name, _ in order] == ["first", "second", "third"]
+    first, second, third = (elapsed for _, elapsed in order)
+    assert 0.09 <= first < 0.2
+    assert 0.29 <= second < 0.4
+    assert 0.39 <= third < 0.5
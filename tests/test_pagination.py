@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from src.services.pagination import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 10, 19, 12, 7, 44, 123456, tzinfo=timezone.utc)
+    cursor = encode_cursor(created_at, 42)
+    assert "=" not in cursor and "/" not in cursor and "+" not in cursor
+    assert decode_cursor(cursor) == (created_at, 42)
+
+    local = created_at.astimezone(timezone(timedelta(hours=3)))
+    assert decode_cursor(encode_cursor(local, 7)) == (local, 7)
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not base64!",
+        encode_cursor(datetime(2026, 1, 1), 1)[:-3],
+        "MjAyNi0xMC0xOQ",  # "2026-10-19" without ID
+        "bm90IGEgZGF0ZXwx",  # "not a date|1"
+        "_-_-",
+    ],
+)
+def test_cursor_malformed(cursor):
+    with pytest.raises(HTTPException) as err:
+        decode_cursor(cursor)
+    assert err.value.status_code == 422
@@ -0,0 +1,85 @@
+import asyncio
+import zipfile
+from io import BytesIO
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image as PILImage
+
+from src.services.auth import auth_service
+from src.services.qr import (
+    _ZipStream,
+    compose_qr_sheet,
+    etag_matches,
+    qr_cache,
+    qr_etag,
+    qr_zip_stream,
+    render_qr_code,
+)
+
+
+def test_etag_matches():
+    etag = '"abc"'
+    assert etag_matches('"abc"', etag)
+    assert etag_matches('"xyz", W/"abc"', etag)
+    assert etag_matches(" * ", etag)
+    assert not etag_matches('"abcd"', etag)
+    assert not etag_matches('"ab"', etag)
+    assert not etag_matches("", etag)
+
+
+def test_qr_token():
+    token = auth_service.create_qr_token(42)
+    assert auth_service.decode_qr_token(token) == 42
+    access = auth_service.create_email_token({"sub": "42", "scope": "access_token"})
+    for bad in (token + "x", access):
+        with pytest.raises(HTTPException) as err:
+            auth_service.decode_qr_token(bad)
+        assert err.value.status_code == 401
+
+
+def test_zip_stream():
+    """ZipFile writes to unseekable stream, and parts form valid archive."""
+    stream = _ZipStream()
+    parts = []
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_STORED) as archive:
+        for name in ("a.png", "b.png"):
+            archive.writestr(name, name.encode() * 100)
+            parts.append(stream.pop())
+    parts.append(stream.pop())
+
+    assert all(parts) and stream.pop() == b""
+    with zipfile.ZipFile(BytesIO(b"".join(parts))) as archive:
+        assert archive.namelist() == ["a.png", "b.png"]
+        assert archive.read("b.png") == b"b.png" * 100
+
+
+def test_qr_zip_stream():
+    datas = ["https://example.com/zip/1", "https://example.com/zip/2"]
+    # cached codes are not rendered in the process pool
+    for data in datas:
+        content = render_qr_code(data, "png")
+        qr_cache.set((data, "png"), (content, qr_etag(content)))
+
+    async def collect():
+        return [part async for part in qr_zip_stream(["1.png", "2.png"], datas)]
+
+    parts = asyncio.run(collect())
+
+    assert len(parts) == 3
+    with zipfile.ZipFile(BytesIO(b"".join(parts))) as archive:
+        assert archive.namelist() == ["1.png", "2.png"]
+        assert archive.read("2.png") == qr_cache.get((datas[1], "png"))[0]
+
+
+def test_compose_qr_sheet():
+    codes = [render_qr_code(f"https://example.com/sheet/{i}", "png") for i in range(5)]
+    tile = max(PILImage.open(BytesIO(code)).size[0] for code in codes)
+
+    with PILImage.open(BytesIO(compose_qr_sheet(codes, "png"))) as sheet:
+        # 5 codes are placed on 3 columns and 2 rows
+        assert sheet.size == (3 * tile, 2 * tile)
+        assert sheet.mode == "L"
+        # the last cell is empty
+        assert sheet.crop((2 * tile, tile, 3 * tile, 2 * tile)).getextrema() == (255, 255)
+    assert compose_qr_sheet(codes, "pdf").startswith(b"%PDF")
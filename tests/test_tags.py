@@ -0,0 +1,205 @@
+import asyncio
+import statistics
+import time
+
+import pytest
+from fastapi import status
+from sqlalchemy import and_, func, insert, or_, select
+
+from src.database.models import Image, Role, Tag, tag_m2m_image
+from src.repository import images as repository_images
+from tests.conftest import create_user_image, session_maker
+
+CONCURRENT_REQUESTS = 12
+LATENCY_SAMPLES = 1000
+
+
+async def legacy_image_add_tag(image_id, tag_name, user, db):
+    """Tag assignment before the single statement: check, then insert."""
+    sq = select(Image).filter(and_(Image.id == image_id,
+                                   or_(user.role == Role.admin,
+                                       user.role == Role.moder,
+                                       Image.user_id == user.id)))
+    image = (await db.execute(sq)).scalar_one_or_none()
+    if image is None:
+        return (status.HTTP_404_NOT_FOUND, "Image is not accessible.")
+    sq = select(Tag).filter(func.lower(Tag.name) == func.lower(tag_name))
+    result = await db.execute(sq)
+    await db.commit()
+    tag = result.first()
+    if tag is None:
+        return (status.HTTP_404_NOT_FOUND, "Tag is not exists.")
+    tag = tag[0]
+    sq = select(tag_m2m_image).where(tag_m2m_image.c.image_id == image.id)
+    result = await db.execute(sq)
+    await db.commit()
+    tags = result.all()
+    for tg in tags:
+        if tg[2] == tag.id:
+            return (status.HTTP_409_CONFLICT, "Already exists.")
+    if len(tags) >= 5:
+        return (status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                "More than 5 tags are not allowed.")
+    await db.execute(insert(tag_m2m_image).values(image_id=image.id, tag_id=tag.id))
+    await db.commit()
+    sq = select(Tag).filter(Tag.id.in_([tg[2] for tg in tags] + [tag.id]))
+    result = await db.execute(sq)
+    await db.commit()
+    return (0, [tg[0].name for tg in result.all()])
+
+
+async def create_tags(db, names):
+    db.add_all([Tag(name=name) for name in names])
+    await db.commit()
+
+
+async def image_tag_rows(db, image_id):
+    sq = select(tag_m2m_image.c.tag_id, tag_m2m_image.c.slot).where(
+        tag_m2m_image.c.image_id == image_id
+    )
+    return (await db.execute(sq)).all()
+
+
+def test_image_add_tag_concurrent_limit(postgres_url):
+    """More than 5 concurrent assignments of different tags keep the cap."""
+    names = [f"race tag {i}" for i in range(CONCURRENT_REQUESTS)]
+
+    async def scenario():
+        engine, sessions = session_maker(postgres_url, CONCURRENT_REQUESTS)
+        try:
+            async with sessions() as db:
+                user, image = await create_user_image(db, "tag_race")
+                await create_tags(db, names)
+
+            async def add(name):
+                async with sessions() as db:
+                    return await repository_images.image_add_tag(
+                        image.id, name, user, db
+                    )
+
+            results = await asyncio.gather(*(add(name) for name in names))
+            async with sessions() as db:
+                rows = await image_tag_rows(db, image.id)
+            return results, rows
+        finally:
+            await engine.dispose()
+
+    results, rows = asyncio.run(scenario())
+
+    codes = [code for code, _ in results]
+    assert len(rows) == 5
+    assert sorted(slot for _, slot in rows) == [1, 2, 3, 4, 5]
+    assert codes.count(0) == 5
+    assert all(
+        code in (status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                 status.HTTP_409_CONFLICT)
+        for code in codes if code != 0
+    )
+
+
+def test_image_add_tag_concurrent_same_tag(postgres_url):
+    """Concurrent assignments of the same tag create one row."""
+
+    async def scenario():
+        engine, sessions = session_maker(postgres_url, CONCURRENT_REQUESTS)
+        try:
+            async with sessions() as db:
+                user, image = await create_user_image(db, "tag_same")
+                await create_tags(db, ["same tag"])
+
+            async def add():
+                async with sessions() as db:
+                    return await repository_images.image_add_tag(
+                        image.id, "Same Tag", user, db
+                    )
+
+            results = await asyncio.gather(*(add() for _ in range(CONCURRENT_REQUESTS)))
+            async with sessions() as db:
+                rows = await image_tag_rows(db, image.id)
+            return results, rows
+        finally:
+            await engine.dispose()
+
+    results, rows = asyncio.run(scenario())
+
+    assert len(rows) == 1
+    assert [code for code, _ in results].count(0) == 1
+    assert all(code in (0, status.HTTP_409_CONFLICT) for code, _ in results)
+
+
+@pytest.mark.benchmark
+def test_image_add_tag_latency(postgres_url):
+    """
+    Compares latency of tag assignment with the former multi-statement one
+    on a warm connection. Run with "pytest -s -m benchmark" to see it.
+    """
+
+    async def measure(add_tag, name):
+        engine, sessions = session_maker(postgres_url)
+        try:
+            async with sessions() as db:
+                tag_names = [f"{name} {i}" for i in range(5)]
+                await create_tags(db, tag_names)
+                latencies = []
+                # The first image warms up statement compilation and prepared
+                # statements of the connection, it is not measured
+                for i in range(LATENCY_SAMPLES // 5 + 1):
+                    user, image = await create_user_image(db, f"{name}_{i}")
+                    for tag_name in tag_names:
+                        started = time.perf_counter()
+                        code, _ = await add_tag(image.id, tag_name, user, db)
+                        if i:
+                            latencies.append(time.perf_counter() - started)
+                        assert code == 0
+            return (
+                statistics.median(latencies) * 1000,
+                statistics.quantiles(latencies, n=100)[98] * 1000,
+            )
+        finally:
+            await engine.dispose()
+
+    before = asyncio.run(measure(legacy_image_add_tag, "latency before"))
+    after = asyncio.run(measure(repository_images.image_add_tag, "latency after"))
+    print(
+        f"\nimage_add_tag latency, ms (median, p99): "
+        f"before {before[0]:.2f}, {before[1]:.2f}; after {after[0]:.2f}, {after[1]:.2f}"
+    )
+
+
+def test_image_set_tags(postgres_url):
+    """Tags of image are replaced by the difference with current ones."""
+
+    async def scenario():
+        engine, sessions = session_maker(postgres_url)
+        try:
+            async with sessions() as db:
+                user, image = await create_user_image(db, "tag_set")
+                await create_tags(db, ["set alpha"])
+                # a failed call rolls back and expires ORM objects
+                image_id = image.id
+                results = [
+                    await repository_images.image_set_tags(
+                        image_id, tags, create, user, db
+                    )
+                    for tags, create in (
+                        (["Set Alpha", "set beta"], True),
+                        (["set beta", "set gamma"], True),
+                        (["set delta"], False),
+                    )
+                ]
+                rows = await image_tag_rows(db, image_id)
+            return results, rows
+        finally:
+            await engine.dispose()
+
+    (first, second, missing), rows = asyncio.run(scenario())
+
+    assert first[1]["tags"] == ["set alpha", "set beta"]
+    assert second[1] == {
+        "image_id": second[1]["image_id"],
+        "tags": ["set gamma", "set beta"],
+        "added": ["set gamma"],
+        "removed": ["set alpha"],
+    }
+    assert missing[0] == status.HTTP_404_NOT_FOUND
+    assert sorted(slot for _, slot in rows) == [1, 2]
@@ -0,0 +1,128 @@
+import asyncio
+from io import BytesIO
+
+import pytest
+from fastapi import HTTPException, UploadFile, status
+from PIL import Image as PILImage
+
+from main import MULTIPART_OVERHEAD, app, upload_body_limit
+from src.conf.config import config
+from src.services import uploads
+from src.services.uploads import read_upload, reencode_image, sniff_format
+
+
+def image_bytes(fmt: str, size=(64, 48), **params) -> bytes:
+    output = BytesIO()
+    PILImage.linear_gradient("L").resize(size).convert("RGB").save(
+        output, format=fmt, **params
+    )
+    return output.getvalue()
+
+
+def test_reencode_image_smaller():
+    """Re-encoded image is stored when it is smaller than original."""
+    data = image_bytes("BMP")
+    reencoded = reencode_image(data, "JPEG", 80)
+    assert len(reencoded) < len(data)
+    assert reencoded.startswith(b"\xff\xd8\xff")
+
+
+def test_reencode_image_not_smaller():
+    """Original image is kept when re-encoding does not save bytes."""
+    data = image_bytes("JPEG", quality=10)
+    assert reencode_image(data, "JPEG", 95) == data
+
+
+def test_sniff_format():
+    assert sniff_format(image_bytes("PNG")) == "PNG"
+    assert sniff_format(image_bytes("JPEG")) == "JPEG"
+    assert sniff_format(image_bytes("WEBP")) == "WEBP"
+    assert sniff_format(b"%PDF-1.7\n" + bytes(16)) is None
+    # HEIF is detected, but Pillow opens it only with a plugin
+    heif = b"\x00\x00\x00\x18ftypheic" + bytes(16)
+    PILImage.init()
+    assert sniff_format(heif) == ("HEIF" if "HEIF" in PILImage.OPEN else None)
+
+
+def read(data: bytes, size: int | None = None) -> bytes:
+    return asyncio.run(read_upload(UploadFile(BytesIO(data), size=size)))
+
+
+def test_read_upload(monkeypatch):
+    data = image_bytes("PNG", size=(300, 200))
+    monkeypatch.setattr(config, "upload_max_size", len(data))
+    monkeypatch.setattr(config, "upload_max_pixels", 300 * 200)
+    monkeypatch.setattr(uploads, "CHUNK_SIZE", 256)
+    assert read(data) == data
+
+    with pytest.raises(HTTPException) as err:
+        read(b"not an image" + bytes(64))
+    assert err.value.status_code == status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+
+    # declared size is checked before reading
+    with pytest.raises(HTTPException) as err:
+        read(data, size=len(data) + 1)
+    assert err.value.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    # unknown size is checked while chunks are read
+    monkeypatch.setattr(config, "upload_max_size", len(data) - 1)
+    with pytest.raises(HTTPException) as err:
+        read(data)
+    assert err.value.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    monkeypatch.setattr(config, "upload_max_size", len(data))
+    monkeypatch.setattr(config, "upload_max_pixels", 300 * 200 - 1)
+    with pytest.raises(HTTPException) as err:
+        read(data)
+    assert err.value.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def post_multipart(path: str, chunks: list, content_length: int | None = None):
+    """Sends multipart body by chunks to the application, returns status."""
+    headers = [(b"content-type", b"multipart/form-data; boundary=x")]
+    if content_length is not None:
+        headers.append((b"content-length", str(content_length).encode()))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "root_path": "", "query_string": b"", "headers": headers,
+        "client": ("test", 1), "server": ("test", 80),
+    }
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks)
+    ]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return sent[0]["status"], len(messages)
+
+
+def test_limit_upload_size(monkeypatch):
+    monkeypatch.setattr(config, "upload_max_size", 1024)
+    limit = upload_body_limit("/api/images/")
+    assert limit == 1024 + MULTIPART_OVERHEAD
+    assert upload_body_limit("/api/images/batch") == (
+        1024 * config.upload_batch_size + MULTIPART_OVERHEAD
+    )
+    assert upload_body_limit("/api/comments/") == MULTIPART_OVERHEAD
+
+    too_large = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    # rejected by Content-Length before the body is received
+    assert post_multipart("/api/images/", [b"x"], limit + 1) == (too_large, 1)
+    # chunked body is rejected as soon as the limit is exceeded
+    part = (
+        b'--x\r\nContent-Disposition: form-data; name="file"; filename="a.png"'
+        b"\r\nContent-Type: image/png\r\n\r\n"
+    )
+    chunks = [part] + [b"a" * 17000] * 5
+    assert post_multipart("/api/images/", chunks) == (too_large, 1)
+    # the same body is within the limit of batch upload
+    code, _ = post_multipart("/api/images/batch/", chunks + [b"\r\n--x--\r\n"])
+    assert code == status.HTTP_401_UNAUTHORIZED
@@ -0,0 +1,26 @@
+import asyncio
+
+from src.services import variants
+from src.services.events import comment_events
+
+
+def test_variant_cache_evict(monkeypatch):
+    """Eviction drops local urls and is broadcast to other workers."""
+    broadcasts = []
+
+    async def broadcast(channel, message):
+        broadcasts.append((channel, message))
+
+    monkeypatch.setattr(comment_events, "broadcast", broadcast)
+    for key in ((1, 100, 100, "fill"), (2, 100, 100, "fill"), (3, 50, 50, "fit")):
+        variants.variant_cache.set(key, ("url", 1))
+
+    asyncio.run(variants.variant_cache_evict([2, 1, 2]))
+
+    assert variants.variant_cache.get((1, 100, 100, "fill")) is None
+    assert variants.variant_cache.get((2, 100, 100, "fill")) is None
+    assert broadcasts == [(variants.EVICT_CHANNEL, {"image_ids": [1, 2]})]
+
+    # another worker handles the broadcast by its listener
+    comment_events._handlers[variants.EVICT_CHANNEL]({"image_ids": [3]})
+    assert variants.variant_cache.get((3, 50, 50, "fit")) is None